@@ -1,68 +1,252 @@
+import asyncio
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from codec import loads
+from http_session import get_session
+from poller import DEFAULT_DEADLINE, wait_until_ready, wait_until_ready_async
 
-class HeadersDoctorClient:
+DEFAULT_BATCH_CONCURRENCY = 10
+CHECKS_PER_AUDIT = 3
+
+
+class _BaseHeadersDoctorClient:
     # BASE_URL = "https://api.headers.doctor/api/v1"
     BASE_URL = "http://localhost:8000"
-    results = {}
 
-    def __init__(self):
+    def __init__(self, session: requests.Session = None, deadline: float = DEFAULT_DEADLINE):
+        self.session = session or get_session()
+        self.deadline = deadline
+        # Only the last result of check_headers is kept, the *_many methods return theirs
+        self.results = {}
         self.headers = {
             "Accept": "application/json",
         }
 
+    def _scan(self, url: str) -> str:
+        # Send the request and get the request id
+        request_response = self.session.post(f"{self.BASE_URL}/results/scan-hostname", headers=self.headers, params={"hostname": url})
+        request_response.raise_for_status()
+        return loads(request_response.content)['scan_id']
+
+    def _get_result(self, request_id: str):
+        response = self.session.get(f"{self.BASE_URL}/results/get_result/{request_id}", headers=self.headers)
+        response.raise_for_status()
+        response = loads(response.content)
+        if isinstance(response, list) and response and "scan_id" in response[0]:
+            return response[0]
+        return None
+
+    def _get(self, path: str, url: str):
+        response = self.session.get(f"{self.BASE_URL}{path}", headers=self.headers, params={"url": url})
+        response.raise_for_status()
+        return loads(response.content)
+
+    @staticmethod
+    def _audit_record(url: str, headers, csp, owasp) -> dict:
+        record = {"url": url}
+        for name, result in (("headers", headers), ("csp", csp), ("owasp", owasp)):
+            record[name] = {"error": str(result)} if isinstance(result, Exception) else result
+        return record
+
+    @staticmethod
+    def _not_found(err: requests.exceptions.HTTPError):
+        if err.response is not None and err.response.status_code == 404:
+            return {"error": "Hostname not found"}
+        raise err
+
+    def get_results(self) -> dict:
+        """
+        Returns the last result of check_headers of this client, or {} if there is none yet.
+        """
+        return self.results
+
+
+class AsyncHeadersDoctorClient(_BaseHeadersDoctorClient):
+    """
+    Headers Doctor client whose checks are coroutines.
+
+    The requests go through the shared keep-alive session on a thread pool of the client,
+    so they never block the event loop, and pending scans are polled with asyncio.sleep.
+    The pool has room for the three checks of `concurrency` URLs at once, and grows if a
+    batch asks for more, so the concurrency of the *_many methods is never capped by it.
+
+    Args:
+        session (requests.Session): The session used for the requests. Defaults to the shared one.
+        deadline (float): Seconds after which waiting for a scan gives up. Defaults to DEFAULT_DEADLINE.
+        concurrency (int): Default number of URLs checked at once by the *_many methods.
+            Defaults to DEFAULT_BATCH_CONCURRENCY.
+    """
+
+    def __init__(self, session: requests.Session = None, deadline: float = DEFAULT_DEADLINE,
+                 concurrency: int = DEFAULT_BATCH_CONCURRENCY):
+        super().__init__(session, deadline)
+        self.concurrency = concurrency
+        self._workers = 0
+        self._executor = None
+        self._reserve(concurrency)
+
+    def _reserve(self, concurrency: int):
+        # full_audit has three requests of a URL in flight at once
+        workers = CHECKS_PER_AUDIT * concurrency
+        if workers > self._workers:
+            previous, self._executor = self._executor, ThreadPoolExecutor(max_workers=workers)
+            self._workers = workers
+            if previous is not None:
+                previous.shutdown(wait=False)
+
+    def close(self):
+        """
+        Stops the thread pool of the client once its requests in flight are done.
+        """
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def check_headers(self, url: str):
+        """
+        Scans the headers of a URL and waits for the result.
+
+        Returns:
+            dict | None: The result, an error if the hostname was not found, or None if the deadline was reached.
+        """
+        try:
+            request_id = await self._call(self._scan, url)
+
+            # Get the results using the request id, backing off while the scan is pending
+            response = await wait_until_ready_async(
+                lambda scan_id: self._call(self._get_result, scan_id), request_id, deadline=self.deadline
+            )
+            if response is not None:
+                self.results = response
+            return response
+
+        except requests.exceptions.HTTPError as err:
+            return self._not_found(err)
+
+    async def check_csp(self, url: str):
+        try:
+            return await self._call(self._get, "/csp", url)
+        except requests.exceptions.HTTPError as err:
+            return self._not_found(err)
+
+    async def owasp_compliance(self, url: str):
+        try:
+            return await self._call(self._get, "/owasp", url)
+        except requests.exceptions.HTTPError as err:
+            return self._not_found(err)
+
+    async def full_audit(self, url: str) -> dict:
+        """
+        Runs check_headers, check_csp and owasp_compliance for a URL concurrently.
+
+        Returns:
+            dict: The url and the headers, csp and owasp results. A check that failed
+                gives {"error": message} without failing the other two.
+        """
+        results = await asyncio.gather(
+            self.check_headers(url), self.check_csp(url), self.owasp_compliance(url), return_exceptions=True
+        )
+        return self._audit_record(url, *results)
+
+    async def _many(self, check, urls, concurrency: int = None) -> dict:
+        concurrency = concurrency or self.concurrency
+        self._reserve(concurrency)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(url):
+            async with slots:
+                return await check(url)
+
+        urls = list(urls)
+        # A URL that fails, e.g. with a body that is not JSON, does not fail the rest of the batch
+        results = await asyncio.gather(*(run(url) for url in urls), return_exceptions=True)
+        return {url: {"error": str(result)} if isinstance(result, Exception) else result
+                for url, result in zip(urls, results)}
+
+    async def check_headers_many(self, urls, concurrency: int = None) -> dict:
+        """
+        Runs check_headers for many URLs concurrently.
+
+        Args:
+            urls (Iterable[str]): The URLs to be checked.
+            concurrency (int): Maximum number of URLs checked at once. Defaults to the concurrency of the client.
+
+        Returns:
+            dict: The result of every URL, keyed by URL. A failed request gives {"error": message}.
+        """
+        return await self._many(self.check_headers, urls, concurrency)
+
+    async def full_audit_many(self, urls, concurrency: int = None) -> dict:
+        """
+        Runs full_audit for many URLs concurrently, see check_headers_many.
+
+        At most `concurrency` URLs are audited at once, each with its three checks in flight.
+        """
+        return await self._many(self.full_audit, urls, concurrency)
+
+    async def check_csp_many(self, urls, concurrency: int = None) -> dict:
+        """
+        Runs check_csp for many URLs concurrently, see check_headers_many.
+        """
+        return await self._many(self.check_csp, urls, concurrency)
+
+    async def owasp_compliance_many(self, urls, concurrency: int = None) -> dict:
+        """
+        Runs owasp_compliance for many URLs concurrently, see check_headers_many.
+        """
+        return await self._many(self.owasp_compliance, urls, concurrency)
+
+
+class HeadersDoctorClient(_BaseHeadersDoctorClient):
+    """
+    Blocking Headers Doctor client. Use AsyncHeadersDoctorClient from async code.
+
+    Args:
+        session (requests.Session): The session used for the requests. Defaults to the shared one.
+        deadline (float): Seconds after which waiting for a scan gives up. Defaults to DEFAULT_DEADLINE.
+    """
+
     def check_headers(self, url: str):
         try:
-            # Send the request and get the request id
-            request_response = requests.post(f"{self.BASE_URL}/results/scan-hostname", headers=self.headers, params={"hostname": url})
-            request_response.raise_for_status()
-            request_id = request_response.json()['scan_id']
-
-            # Get the results using the request id
-            loop = True
-            while loop:
-                response = requests.get(f"{self.BASE_URL}/results/get_result/{request_id}", headers=self.headers)
-                response.raise_for_status() 
-                response = response.json()
-                if isinstance(response, list):
-                    response = response[0]
-                    if "scan_id" in response:
-                        loop = False
-                        self.results = response
+            request_id = self._scan(url)
+
+            # Get the results using the request id, backing off while the scan is pending
+            response = wait_until_ready(self._get_result, request_id, deadline=self.deadline)
+            if response is not None:
+                self.results = response
             return response
 
         except requests.exceptions.HTTPError as err:
-            if err.response.status_code == 404:
-                return {"error": "Hostname not found"}
-            else:
-                raise err
-    
-    def get_results(self):
-        return self.results
-            
+            return self._not_found(err)
+
     def check_csp(self, url: str):
         try:
-            response = requests.get(f"{self.BASE_URL}/csp", headers=self.headers, params={"url": url})  
-            response.raise_for_status()
-            return response.json()
+            return self._get("/csp", url)
         except requests.exceptions.HTTPError as err:
-            if err.response.status_code == 404:
-                return {"error": "Hostname not found"}
-            else:
-                raise err
+            return self._not_found(err)
 
     def owasp_compliance(self, url: str):
         try:
-            response = requests.get(f"{self.BASE_URL}/owasp", headers=self.headers, params={"url": url})
-            response.raise_for_status()
-            return response.json()
+            return self._get("/owasp", url)
         except requests.exceptions.HTTPError as err:
-            if err.response.status_code == 404:
-                return {"error": "Hostname not found"}
-            else:
-                raise err
+            return self._not_found(err)
+
+    def full_audit(self, url: str) -> dict:
+        """
+        Runs check_headers, check_csp and owasp_compliance for a URL concurrently.
+
+        Returns:
+            dict: The url and the headers, csp and owasp results. A check that failed
+                gives {"error": message} without failing the other two.
+        """
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(check, url) for check in (self.check_headers, self.check_csp, self.owasp_compliance)]
+        return self._audit_record(url, *(future.exception() or future.result() for future in futures))
 
-test = HeadersDoctorClient()
-print(test.check_headers("https://www.google.com"))
-# print(test.check_csp("https://www.google.com"))
-# print(test.owasp_compliance("https://www.google.com"))
 
+if __name__ == '__main__':
+    test = HeadersDoctorClient()
+    print(test.check_headers("https://www.google.com"))
+    # print(test.check_csp("https://www.google.com"))
+    # print(test.owasp_compliance("https://www.google.com"))
@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from mock_server import MockHeadersDoctorAPI, parse_distribution
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_STARTUP_RUNS = 20
+SCAN_HEADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_headers.py")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of the given values.
+
+    Args:
+        values (list[float]): The values.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def run_pipeline(api: MockHeadersDoctorAPI, size: int, directory: str, extra_args: list[str]) -> dict:
+    """
+    Scans `size` hosts with the scan_headers.py pipeline against the mock API.
+
+    Args:
+        api (MockHeadersDoctorAPI): The running mock API.
+        size (int): Number of hosts to scan.
+        directory (str): Working directory of the run.
+        extra_args (list[str]): Extra scan_headers.py arguments.
+
+    Returns:
+        dict: hosts, seconds, hosts_per_second, delivered, p50 and p99 end-to-end latency
+            in seconds, peak_rss_mb of the scan_headers.py process and its exit_code.
+    """
+    hosts_file = os.path.join(directory, f"hosts_{size}.txt")
+    with open(hosts_file, "w") as f:
+        f.writelines(f"host{i}.bench.test\n" for i in range(size))
+    api.reset()
+    command = [
+        sys.executable, SCAN_HEADERS,
+        "-f", hosts_file,
+        "-s", os.path.join(directory, f"results_{size}"),
+        "-o", "jsonl",
+        "--api_url", api.url,
+        "--poll_rate", "0",
+        *extra_args,
+    ]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    latencies = api.latencies()
+    return {
+        "hosts": size,
+        "seconds": round(seconds, 3),
+        "hosts_per_second": round(size / seconds, 1),
+        "delivered": len(latencies),
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        "peak_rss_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "exit_code": os.waitstatus_to_exitcode(status),
+    }
+
+
+def measure_startup(directory: str, runs: int = DEFAULT_STARTUP_RUNS) -> list[dict]:
+    """
+    Measures the cold start of the interpreter, of importing the modules and of short scan_headers.py commands.
+
+    Every command runs `runs` times in a new process, from `directory` so no log is left behind.
+
+    Args:
+        directory (str): Working directory of the commands.
+        runs (int): Runs of every command. Defaults to DEFAULT_STARTUP_RUNS.
+
+    Returns:
+        list[dict]: The command, min and p50 milliseconds of every command.
+    """
+    package = os.path.dirname(SCAN_HEADERS)
+    commands = {
+        "python -c pass": [sys.executable, "-c", "pass"],
+        "import scan_headers": [sys.executable, "-c", "import scan_headers"],
+        "import api_client": [sys.executable, "-c", "import api_client"],
+        "scan_headers.py --help": [sys.executable, SCAN_HEADERS, "--help"],
+        "scan_headers.py --query": [sys.executable, SCAN_HEADERS, "--store", os.path.join(directory, "startup.db"), "--query"],
+    }
+    env = dict(os.environ, PYTHONPATH=package)
+    results = []
+    for name, command in commands.items():
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(command, cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append((time.perf_counter() - started) * 1000)
+        results.append({"command": name, "min_ms": round(min(times), 1), "p50_ms": round(percentile(times, 0.5), 1)})
+    return results
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Benchmark the scan_headers.py pipeline against a local mock API. '
+                    'Unknown arguments are passed to scan_headers.py.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Numbers of hosts to scan (default 1000 10000 100000).')
+    parser.add_argument('--latency', type=str, default="fixed:0.02", help='Latency of every API request: fixed:S, uniform:MIN:MAX or exp:MEAN (default fixed:0.02).')
+    parser.add_argument('--pending', type=str, default="uniform:0.5:2", help='How long scans stay pending: fixed:S, uniform:MIN:MAX or exp:MEAN (default uniform:0.5:2).')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of API requests answered with 503 (default 0).')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON lines instead of a table.')
+    parser.add_argument('--startup', action='store_true', help='Measure the import time and cold start of the CLI instead of the pipeline.')
+    parser.add_argument('--runs', type=int, default=DEFAULT_STARTUP_RUNS, help=f'Runs of every command with --startup (default {DEFAULT_STARTUP_RUNS}).')
+    args, extra_args = parser.parse_known_args()
+
+    if args.startup:
+        with tempfile.TemporaryDirectory() as directory:
+            results = measure_startup(directory, args.runs)
+        if not args.json:
+            print(f"{'command':<26} {'min ms':>8} {'p50 ms':>8}")
+        for result in results:
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{result['command']:<26} {result['min_ms']:>8} {result['p50_ms']:>8}")
+        return
+
+    api = MockHeadersDoctorAPI(port=0, latency=parse_distribution(args.latency),
+                               pending=parse_distribution(args.pending), error_rate=args.error_rate).start()
+    try:
+        if not args.json:
+            print(f"{'hosts':>8} {'seconds':>9} {'hosts/s':>9} {'delivered':>10} {'p50 s':>7} {'p99 s':>7} {'peak RSS MB':>12}")
+        with tempfile.TemporaryDirectory() as directory:
+            for size in args.sizes:
+                result = run_pipeline(api, size, directory, extra_args)
+                if args.json:
+                    print(json.dumps(result), flush=True)
+                else:
+                    print(f"{result['hosts']:>8} {result['seconds']:>9} {result['hosts_per_second']:>9} "
+                          f"{result['delivered']:>10} {result['p50']:>7} {result['p99']:>7} {result['peak_rss_mb']:>12}",
+                          flush=True)
+    finally:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
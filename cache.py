@@ -0,0 +1,125 @@
+import threading
+import time
+from codec import ResultRecord, as_record, decode_result
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 100000
+
+
+class ResultCache:
+    """
+    Local SQLite cache of scan results keyed by hostname and port.
+
+    A host whose cached result is younger than `ttl` seconds does not need to be
+    scanned again. When more than `max_entries` results are stored, the least
+    recently used ones are evicted.
+
+    Args:
+        path (str): The path to the SQLite database file.
+        ttl (float): Seconds a result stays fresh. Defaults to DEFAULT_CACHE_TTL.
+        max_entries (int): Maximum number of cached results. Defaults to DEFAULT_CACHE_SIZE.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        import sqlite3
+        # Lookups happen from the submission threads, so the connection is shared behind the lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " host TEXT NOT NULL, port INTEGER NOT NULL, scan_id TEXT NOT NULL,"
+            " scanned_at REAL NOT NULL, last_used REAL NOT NULL, result TEXT NOT NULL,"
+            " PRIMARY KEY (host, port))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_scan_id ON results (scan_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.purge()
+
+    def get(self, host: str, port: int) -> str | None:
+        """
+        Returns the scan_id of a fresh cached result for the given host and port.
+
+        Args:
+            host (str): The normalized hostname.
+            port (int): The port.
+
+        Returns:
+            str | None: The scan_id, or None if there is no fresh result.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scan_id FROM results WHERE host = ? AND port = ? AND scanned_at > ?",
+                (host, int(port), now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE host = ? AND port = ?", (now, host, int(port)))
+            self._db.commit()
+        return row[0]
+
+    def get_result(self, scan_id: str) -> ResultRecord | None:
+        """
+        Returns the cached result of a scan.
+
+        Args:
+            scan_id (str): The id of the scan.
+
+        Returns:
+            ResultRecord | None: The result, or None if it is not cached.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT result FROM results WHERE scan_id = ?", (scan_id,)).fetchone()
+        return decode_result(row[0]) if row else None
+
+    def put(self, result: ResultRecord | list):
+        """
+        Stores a result returned by the API, evicting the least recently used ones if the cache is full.
+
+        Args:
+            result (ResultRecord | list): The result of the scan. It must have url, port and scan_id.
+
+        Returns:
+            None
+        """
+        record = as_record(result)
+        now = time.time()
+        key = (record.url, record.port)
+        with self._lock:
+            exists = self._db.execute("SELECT 1 FROM results WHERE host = ? AND port = ?", key).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (host, port, scan_id, scanned_at, last_used, result)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                # Stored as the list returned by the API, so get_result decodes it like a response
+                (*key, record.scan_id, now, now, (b"[" + record.raw + b"]").decode()),
+            )
+            if not exists:
+                self._size += 1
+            if self._size > self.max_entries:
+                deleted = self._db.execute(
+                    "DELETE FROM results WHERE rowid IN"
+                    " (SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                    (self._size - self.max_entries,),
+                ).rowcount
+                self._size -= deleted
+            self._db.commit()
+
+    def purge(self):
+        """
+        Deletes the results older than the TTL.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE scanned_at <= ?", (time.time() - self.ttl,))
+            self._db.commit()
+            self._size = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
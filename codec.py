@@ -0,0 +1,109 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: bytes | str) -> any:
+    """
+    Decodes JSON with orjson if it is installed, or with the json module otherwise.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: any) -> bytes:
+    """
+    Encodes a value as compact JSON bytes with orjson if it is installed, or with the json module otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class ResultRecord:
+    """
+    A scan result decoded once, with the fields the pipeline needs and its original bytes.
+
+    The sinks, the cache and the results store write `raw` as it came from the API, so
+    a result is never encoded again on its way to disk.
+
+    Args:
+        data (dict): The decoded result, the first item of the list returned by the API.
+        raw (bytes): The JSON of `data` as returned by the API, on a single line. If None,
+            it is encoded from `data` the first time it is needed. Defaults to None.
+    """
+
+    __slots__ = ("scan_id", "url", "port", "date", "score", "data", "_raw")
+
+    def __init__(self, data: dict, raw: bytes = None):
+        self.data = data
+        self._raw = raw
+        self.scan_id = data.get('scan_id')
+        self.url = data['url']
+        self.port = int(data['port'])
+        self.date = str(data['date'])
+        score = data.get('score', data.get('security_score'))
+        try:
+            self.score = float(score) if score is not None else None
+        except (TypeError, ValueError):
+            self.score = None
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = dumps(self.data)
+        return self._raw
+
+    def __getitem__(self, key: str) -> any:
+        return self.data[key]
+
+    def __repr__(self) -> str:
+        return f"ResultRecord(scan_id={self.scan_id!r}, url={self.url!r}, port={self.port}, date={self.date!r}, score={self.score})"
+
+
+def decode_result(body: bytes | str) -> ResultRecord | None:
+    """
+    Decodes the body of a get_result response once.
+
+    Args:
+        body (bytes | str): The body, a JSON list with the result, empty while the scan is pending.
+
+    Returns:
+        ResultRecord | None: The result, or None if the scan is pending.
+    """
+    data = loads(body)
+    if not data:
+        return None
+    raw = None
+    if isinstance(body, str):
+        body = body.encode()
+    body = body.strip()
+    # The API returns a list with a single result, so its bytes are the list without the brackets
+    if len(data) == 1 and body[:1] == b"[" and body[-1:] == b"]":
+        raw = body[1:-1].strip()
+        if b"\n" in raw:
+            raw = None
+    return ResultRecord(data[0], raw)
+
+
+def as_record(result: any) -> ResultRecord:
+    """
+    Returns a result as a ResultRecord, whether it already is one, a list as returned by the API or a single dict.
+
+    Args:
+        result (any): The result.
+
+    Returns:
+        ResultRecord: The record.
+    """
+    if isinstance(result, ResultRecord):
+        return result
+    if isinstance(result, list):
+        result = result[0]
+    return ResultRecord(result)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+import time
+
+# Fields that change on every scan without the posture of the host changing
+VOLATILE_FIELDS = frozenset({"scan_id", "date", "url", "port"})
+
+
+def _normalize(value: any) -> any:
+    if isinstance(value, dict):
+        return {str(key).strip().lower(): _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return sorted((_normalize(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def fingerprint(record: dict) -> bytes:
+    """
+    Returns a 16-byte hash of the header posture of a result: its headers, score and
+    every other field except the ones in VOLATILE_FIELDS.
+
+    Header names are lowercased, values stripped and lists sorted, so the same posture
+    always gives the same fingerprint whatever order the API returns it in.
+
+    Args:
+        record (dict): The first item of a result returned by the API.
+
+    Returns:
+        bytes: The fingerprint.
+    """
+    posture = {key: value for key, value in record.items() if key not in VOLATILE_FIELDS}
+    canonical = json.dumps(_normalize(posture), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+class FingerprintStore:
+    """
+    Local SQLite store of the last fingerprint and score of every host, for incremental runs.
+
+    diff() compares results with the previous run without storing anything, and update()
+    stores the fingerprints of the changed ones once they are written, in a single
+    transaction per batch. A result that could not be written is reported as changed
+    again on the next run. Unchanged hosts cost a single indexed read, so runs where
+    little changed write almost nothing. Shards can share the file like the result cache.
+
+    Args:
+        path (str): The path to the SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        import sqlite3
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " host TEXT NOT NULL, port INTEGER NOT NULL, fingerprint BLOB NOT NULL,"
+            " score REAL, updated_at REAL NOT NULL, PRIMARY KEY (host, port))"
+        )
+
+    def diff(self, records: list[dict]) -> list[bytes | None]:
+        """
+        Tells which results changed posture since the previous run, without storing anything.
+
+        Args:
+            records (list[dict]): The first items of results returned by the API. They must have url and port.
+
+        Returns:
+            list[bytes | None]: For every result, its new fingerprint if the host is new or its
+                fingerprint changed, or None if it is unchanged.
+        """
+        digests = []
+        with self._lock:
+            for record in records:
+                digest = fingerprint(record)
+                row = self._db.execute("SELECT fingerprint FROM fingerprints WHERE host = ? AND port = ?",
+                                       (record['url'], int(record['port']))).fetchone()
+                digests.append(None if row is not None and row[0] == digest else digest)
+        return digests
+
+    def update(self, records: list[dict], digests: list[bytes]):
+        """
+        Stores the fingerprints of written results in a single transaction.
+
+        Args:
+            records (list[dict]): The first items of results returned by the API.
+            digests (list[bytes]): Their fingerprints, as returned by diff().
+
+        Returns:
+            None
+        """
+        now = time.time()
+        rows = [(record['url'], int(record['port']), digest, record.get('score'), now)
+                for record, digest in zip(records, digests)]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO fingerprints (host, port, fingerprint, score, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
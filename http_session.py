@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from ratelimit import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, RETRY_STATUSES, CircuitBreaker,
+                       RetryPolicy, TokenBucket)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class ResilientSession(requests.Session):
+    """
+    Session that rate limits, retries and pauses the requests to the API.
+
+    Every request, including retries, takes a token from the bucket. Responses with a
+    status in RETRY_STATUSES and connection errors are retried following the retry policy,
+    honoring Retry-After. Consecutive 5xx responses and connection errors open the
+    circuit breaker, which pauses every request until its cooldown ends. Once the retries
+    are exhausted the last response is returned, or the last exception raised.
+
+    Requests without a timeout get `timeout`, so a stalled connection raises a Timeout
+    that is retried instead of blocking its thread forever.
+
+    Args:
+        bucket (TokenBucket): The rate limit shared by every request. Defaults to no limit.
+        retry (RetryPolicy): The retry policy. Defaults to RetryPolicy().
+        breaker (CircuitBreaker): The circuit breaker. Defaults to CircuitBreaker().
+        timeout (tuple[float, float]): The default (connect, read) timeout in seconds.
+            Defaults to (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT).
+    """
+
+    def __init__(self, bucket: TokenBucket = None, retry: RetryPolicy = None, breaker: CircuitBreaker = None,
+                 timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)):
+        super().__init__()
+        self.bucket = bucket or TokenBucket(0)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        logger = logging.getLogger(__name__)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.wait()
+            self.bucket.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.retry.max_retries:
+                    raise
+                response = None
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retry.max_retries:
+                    return response
+            attempt += 1
+            delay = self.retry.delay(attempt, response.headers.get("Retry-After") if response is not None else None)
+            status = response.status_code if response is not None else "connection error"
+            logger.warning(f"{method} {url} failed ({status}), retry {attempt}/{self.retry.max_retries} in {delay:.1f}s")
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE, rate_limit: float = 0,
+                   retry: RetryPolicy = None, breaker: CircuitBreaker = None,
+                   timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)) -> requests.Session:
+    """
+    Creates a session that keeps up to `pool_size` connections alive per host.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host. It should be at least
+            the number of threads sending requests, or extra connections are closed after use.
+        rate_limit (float): Maximum requests per second, 0 for no limit. Defaults to 0.
+        retry (RetryPolicy): The retry policy. Defaults to RetryPolicy().
+        breaker (CircuitBreaker): The circuit breaker. Defaults to CircuitBreaker().
+        timeout (tuple[float, float]): The default (connect, read) timeout of the requests in seconds.
+            Defaults to (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT).
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = ResilientSession(TokenBucket(rate_limit), retry, breaker, timeout)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE, rate_limit: float = 0,
+                      retry: RetryPolicy = None, breaker: CircuitBreaker = None,
+                      timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)) -> requests.Session:
+    """
+    Replaces the shared session with one using the given settings, see create_session.
+
+    Returns:
+        requests.Session: The new shared session.
+    """
+    global _session
+    with _session_lock:
+        previous, _session = _session, create_session(pool_size, rate_limit, retry, breaker, timeout)
+    if previous is not None:
+        previous.close()
+    return _session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the session shared by the CLI and the client, creating it on first use.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
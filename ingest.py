@@ -0,0 +1,123 @@
+import hashlib
+import itertools
+import logging
+import math
+from typing import Iterator
+from metrics import METRICS
+from sharding import shard_of
+from normalize import HostRecord, split_valid
+
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_ERROR_RATE = 1e-6
+CHUNK_SIZE = 4096
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership filter that may report false positives but never false negatives.
+
+    Args:
+        capacity (int): Number of items the filter is sized for.
+        error_rate (float): False positive rate once `capacity` items were added.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str):
+        for p in self._positions(key):
+            self._bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that adds a larger, stricter filter each time the current one is full,
+    so memory grows with the number of unique items instead of being sized up front.
+
+    Args:
+        capacity (int): Number of items the first filter is sized for.
+        error_rate (float): Overall false positive rate.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Halving the error rate of every new filter keeps the sum bounded by error_rate
+        self._filters = [BloomFilter(capacity, error_rate / 2)]
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in f for f in self._filters)
+
+    def add(self, key: str):
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            n = len(self._filters)
+            current = BloomFilter(self.capacity * 2 ** n, self.error_rate / 2 ** (n + 1))
+            self._filters.append(current)
+        current.add(key)
+
+
+def read_hosts(file_path: str, default_port: int = None, on_invalid=None, capacity: int = DEFAULT_CAPACITY,
+               error_rate: float = DEFAULT_ERROR_RATE, shard: tuple[int, int] = None) -> Iterator[HostRecord]:
+    """
+    Lazily reads a hosts file, yielding every valid normalized host once.
+
+    Lines are parsed and validated in chunks of CHUNK_SIZE. Duplicates are detected with a scalable Bloom filter, so memory stays a few bytes per
+    unique host however large the file is. A unique host is skipped with probability
+    at most `error_rate`.
+
+    Args:
+        file_path (str): The path to the file with one host per line.
+        default_port (int): The port of the hosts that do not set one. Defaults to None.
+        on_invalid (callable): Called with the HostRecord of every invalid line. Defaults to None.
+        capacity (int): Unique hosts the first Bloom filter is sized for. Defaults to DEFAULT_CAPACITY.
+        error_rate (float): Maximum rate of unique hosts taken for duplicates. Defaults to DEFAULT_ERROR_RATE.
+        shard (tuple[int, int]): If given as (index, shards), only the hosts of that shard are read,
+            invalid ones included. Defaults to None.
+
+    Returns:
+        Iterator[HostRecord]: The normalized hosts.
+    """
+    logger = logging.getLogger(__name__)
+    seen = ScalableBloomFilter(capacity, error_rate)
+    duplicates = 0
+    with open(file_path, "r") as file:
+        while chunk := list(itertools.islice(file, CHUNK_SIZE)):
+            with METRICS.timer("validate_seconds"):
+                valid, invalid = split_valid(chunk)
+            if shard is not None:
+                index, shards = shard
+                count = len(valid) + len(invalid)
+                valid = [record for record in valid if shard_of(record.host, shards) == index]
+                invalid = [record for record in invalid if shard_of(record.host, shards) == index]
+                METRICS.inc("hosts_other_shard", count - len(valid) - len(invalid))
+            METRICS.inc("hosts_invalid", len(invalid))
+            if on_invalid is not None:
+                for record in invalid:
+                    on_invalid(record)
+            for record in valid:
+                if record.port is None and default_port is not None:
+                    record = record._replace(port=default_port)
+                key = f"{record.host}:{record.port}"
+                if key in seen:
+                    duplicates += 1
+                    METRICS.inc("hosts_duplicate")
+                    continue
+                seen.add(key)
+                yield record
+    if duplicates:
+        logger.info(f"Skipped {duplicates} duplicate hosts in {file_path}")
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_SYNC_INTERVAL = 1.0
+
+SUBMITTED = "submitted"
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class JournalState:
+    """
+    Last known state of every host in a journal.
+
+    Attributes:
+        hosts (dict): Maps (host, port) to a (state, scan_id) tuple.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+
+    def is_started(self, host: str, port: int | None) -> bool:
+        """
+        Tells whether a host was queued in the journaled run, so it must not be submitted again.
+
+        Args:
+            host (str): The normalized hostname.
+            port (int | None): The port, or None to check the 443 and 80 fallbacks.
+
+        Returns:
+            bool: True if the host is done or its scan is still in flight.
+        """
+        for _port in ([port] if port is not None else [443, 80]):
+            state = self.hosts.get((host, _port))
+            if state is not None and state[0] != FAILED:
+                return True
+        return False
+
+    def in_flight(self) -> list[tuple[str, str, int]]:
+        """
+        Returns the scans that were queued but whose result was not saved.
+
+        Returns:
+            list[tuple[str, str, int]]: The (scan_id, host, port) of every scan in flight.
+        """
+        return [
+            (scan_id, host, port)
+            for (host, port), (state, scan_id) in self.hosts.items()
+            if state in (SUBMITTED, PENDING)
+        ]
+
+
+class ScanJournal:
+    """
+    Append-only JSON Lines journal of the state of every host in a run.
+
+    Records are written through a buffered file and a background thread flushes and
+    fsyncs it every `sync_interval` seconds, so the journal costs one fsync per interval
+    instead of one per host. Closing the journal syncs what is left.
+
+    Args:
+        path (str): The path to the journal file. It is appended to if it exists.
+        sync_interval (float): Seconds between syncs. Defaults to DEFAULT_SYNC_INTERVAL.
+    """
+
+    def __init__(self, path: str, sync_interval: float = DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sync_loop, args=(sync_interval,), daemon=True)
+        self._thread.start()
+
+    def record(self, state: str, host: str, port: int, scan_id: str = None):
+        """
+        Appends the new state of a host.
+
+        Args:
+            state (str): One of SUBMITTED, PENDING, DONE or FAILED.
+            host (str): The normalized hostname.
+            port (int): The port.
+            scan_id (str): The id of the scan, if it was queued. Defaults to None.
+
+        Returns:
+            None
+        """
+        line = json.dumps({"state": state, "host": host, "port": port, "scan_id": scan_id, "time": time.time()})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._dirty = True
+
+    def sync(self):
+        """
+        Flushes the journal and fsyncs it to disk if anything was recorded since the last sync.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if not self._dirty or self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def _sync_loop(self, interval: float):
+        logger = logging.getLogger(__name__)
+        while not self._stop.wait(interval):
+            try:
+                self.sync()
+            except OSError as e:
+                logger.error(f"It was not possible to sync the journal {self.path}. Error: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def load(path: str, state: JournalState = None) -> JournalState:
+        """
+        Replays a journal, keeping the last state of every host.
+
+        A truncated last line, left by a crash during a write, is ignored.
+
+        Args:
+            path (str): The path to the journal file.
+            state (JournalState): If given, the journal is replayed on top of it, e.g. to load
+                a shard journal after the merged one. Defaults to None.
+
+        Returns:
+            JournalState: The state of the journaled run. It is empty if the file does not exist.
+        """
+        logger = logging.getLogger(__name__)
+        state = state if state is not None else JournalState()
+        if not os.path.exists(path):
+            return state
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring a malformed line in the journal {path}")
+                    continue
+                key = (entry["host"], entry["port"])
+                scan_id = entry["scan_id"] or state.hosts.get(key, (None, None))[1]
+                state.hosts[key] = (entry["state"], scan_id)
+        return state
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+RESERVOIR_SIZE = 1024
+PROGRESS_INTERVAL = 1.0
+PREFIX = "headers_doctor"
+
+
+class Summary:
+    """
+    Count, sum and maximum of observed values, with a fixed-size random sample for quantiles.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._sample = []
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self._sample) < RESERVOIR_SIZE:
+            self._sample.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < RESERVOIR_SIZE:
+                self._sample[index] = value
+
+    def quantile(self, fraction: float) -> float:
+        if not self._sample:
+            return 0.0
+        sample = sorted(self._sample)
+        return sample[min(len(sample) - 1, int(fraction * len(sample)))]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "max": round(self.max, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p99": round(self.quantile(0.99), 6),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and per-stage summaries of a run.
+
+    Counters only go up, gauges go up and down or are read from a function, and
+    summaries collect stage timings in seconds or other per-item values like polls per scan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self._counters = {}
+            self._gauges = {}
+            self._gauge_functions = {}
+            self._summaries = {}
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def track(self, name: str, delta: int):
+        """
+        Moves a gauge up or down, e.g. +1 when a request starts and -1 when it ends.
+        """
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def gauge(self, name: str, function):
+        """
+        Registers a gauge whose value is read from `function` when the metrics are reported.
+        """
+        with self._lock:
+            self._gauge_functions[name] = function
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            if name not in self._summaries:
+                self._summaries[name] = Summary()
+            self._summaries[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Observes the seconds spent in the with block in the summary `name`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        """
+        Returns every metric.
+
+        Returns:
+            dict: elapsed seconds, counters, gauges and summaries.
+        """
+        with self._lock:
+            gauges = dict(self._gauges)
+            functions = dict(self._gauge_functions)
+            snapshot = {
+                "elapsed": round(time.perf_counter() - self.started, 3),
+                "counters": dict(self._counters),
+                "summaries": {name: summary.to_dict() for name, summary in self._summaries.items()},
+            }
+        for name, function in functions.items():
+            gauges[name] = function()
+        snapshot["gauges"] = gauges
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {PREFIX}_elapsed_seconds gauge",
+            f"{PREFIX}_elapsed_seconds {snapshot['elapsed']}",
+        ]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {PREFIX}_{name}_total counter", f"{PREFIX}_{name}_total {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines += [f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name} {value}"]
+        for name, summary in sorted(snapshot["summaries"].items()):
+            lines += [
+                f"# TYPE {PREFIX}_{name} summary",
+                f'{PREFIX}_{name}{{quantile="0.5"}} {summary["p50"]}',
+                f'{PREFIX}_{name}{{quantile="0.99"}} {summary["p99"]}',
+                f"{PREFIX}_{name}_sum {summary['sum']}",
+                f"{PREFIX}_{name}_count {summary['count']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """
+        Writes every metric to a file, in the Prometheus text format if it ends with .prom and as JSON otherwise.
+        """
+        with open(path, "w") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=4)
+
+
+METRICS = Metrics()
+
+
+def count_lines(path: str) -> int:
+    """
+    Counts the lines of a file reading it in binary blocks.
+    """
+    lines = 0
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            lines += block.count(b"\n")
+    return lines
+
+
+def progress_line(total: int = None) -> str:
+    """
+    Formats the progress of the run with its throughput and, if the total is known, its ETA.
+
+    Args:
+        total (int): Number of hosts of the run. Defaults to None.
+
+    Returns:
+        str: The progress line.
+    """
+    snapshot = METRICS.snapshot()
+    counters, gauges = snapshot["counters"], snapshot["gauges"]
+    done = counters.get("results_done", 0)
+    finished = done + sum(counters.get(name, 0) for name in ("submit_failed", "hosts_invalid", "hosts_duplicate", "results_expired", "hosts_skipped", "hosts_other_shard", "hosts_unresolved", "hosts_unreachable"))
+    rate = done / snapshot["elapsed"] if snapshot["elapsed"] else 0.0
+    line = f"done {done}"
+    if total:
+        line += f"/{total} ({100 * finished / total:.1f}%)"
+    line += (f" | submitting {gauges.get('submissions_in_flight', 0)}"
+             f" | pending {gauges.get('pending_scans', 0)}"
+             f" | failed {counters.get('submit_failed', 0) + counters.get('hosts_invalid', 0)}"
+             f" | {rate:.1f} hosts/s")
+    if total and rate and finished < total:
+        line += f" | ETA {int((total - finished) / rate)}s"
+    return line
+
+
+async def report_progress(total: int = None, interval: float = PROGRESS_INTERVAL, stream=None):
+    """
+    Rewrites the progress line on the terminal every `interval` seconds until it is cancelled.
+
+    Args:
+        total (int): Number of hosts of the run. Defaults to None.
+        interval (float): Seconds between updates. Defaults to PROGRESS_INTERVAL.
+        stream: Where the line is written. Defaults to sys.stderr.
+
+    Returns:
+        None
+    """
+    stream = stream or sys.stderr
+    try:
+        while True:
+            stream.write("\r\033[K" + progress_line(total))
+            stream.flush()
+            await asyncio.sleep(interval)
+    finally:
+        stream.write("\r\033[K" + progress_line(total) + "\n")
+        stream.flush()
@@ -0,0 +1,238 @@
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8000
+
+SECURITY_HEADERS = (
+    "content-security-policy",
+    "strict-transport-security",
+    "x-frame-options",
+    "x-content-type-options",
+    "referrer-policy",
+    "permissions-policy",
+    "cross-origin-opener-policy",
+    "cross-origin-embedder-policy",
+    "cross-origin-resource-policy",
+    "x-permitted-cross-domain-policies",
+)
+
+
+def parse_distribution(spec: str):
+    """
+    Parses a duration distribution.
+
+    Args:
+        spec (str): "fixed:SECONDS", "uniform:MIN:MAX" or "exp:MEAN".
+
+    Returns:
+        callable: Function that returns a sample in seconds.
+
+    Raises:
+        ValueError: If the spec is not valid.
+    """
+    kind, _, values = spec.partition(":")
+    numbers = [float(value) for value in values.split(":")] if values else []
+    if kind == "fixed" and len(numbers) == 1:
+        return lambda: numbers[0]
+    if kind == "uniform" and len(numbers) == 2:
+        return lambda: random.uniform(*numbers)
+    if kind == "exp" and len(numbers) == 1:
+        return lambda: random.expovariate(1 / numbers[0]) if numbers[0] > 0 else 0.0
+    raise ValueError(f"Invalid distribution {spec}, expected fixed:S, uniform:MIN:MAX or exp:MEAN")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: any):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str):
+        api = self.server.api
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if api.latency:
+            time.sleep(api.latency())
+        if api.error_rate and random.random() < api.error_rate:
+            return self._send(503, {"detail": "Service unavailable"})
+        status, response = api.route(method, url.path, params, body)
+        self._send(status, response)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class MockHeadersDoctorAPI:
+    """
+    Local stand-in for the Headers Doctor API, for benchmarks and offline development.
+
+    It implements /results/scan-hostname, /results/get_result/{id}, /results/scores, /csp and /owasp.
+    Every request waits a sampled latency and fails with 503 with probability `error_rate`.
+    Scans stay pending for a sampled duration. The time from the submission of each
+    scan to the delivery of its result is recorded.
+
+    Args:
+        host (str): The interface to listen on. Defaults to 127.0.0.1.
+        port (int): The port to listen on, 0 for any free port. Defaults to DEFAULT_PORT.
+        latency (callable): Returns the latency of a request in seconds. Defaults to none.
+        pending (callable): Returns how long a scan stays pending in seconds. Defaults to none.
+        error_rate (float): Fraction of requests answered with 503. Defaults to 0.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, latency=None, pending=None,
+                 error_rate: float = 0.0):
+        self.latency = latency
+        self.pending = pending or (lambda: 0.0)
+        self.error_rate = error_rate
+        self.requests = 0
+        self._scans = {}
+        self._latencies = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serves the API from a background thread.
+
+        Returns:
+            MockHeadersDoctorAPI: The API itself.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def latencies(self) -> list[float]:
+        """
+        Returns the seconds between the submission of every delivered scan and the delivery of its result.
+        """
+        with self._lock:
+            return list(self._latencies)
+
+    def reset(self):
+        with self._lock:
+            self._scans.clear()
+            self._latencies.clear()
+            self.requests = 0
+
+    def route(self, method: str, path: str, params: dict, body: bytes) -> tuple[int, any]:
+        with self._lock:
+            self.requests += 1
+        if method == "POST" and path == "/results/scan-hostname":
+            return self._scan(params)
+        if method == "GET" and path.startswith("/results/get_result/"):
+            return self._get_result(path.rsplit("/", 1)[1])
+        if method == "POST" and path == "/results/scores":
+            return self._score(body)
+        if method == "GET" and path == "/csp":
+            return 200, {"url": params.get("url"), "csp": {"present": random.random() < 0.5, "issues": []}}
+        if method == "GET" and path == "/owasp":
+            return 200, {"url": params.get("url"), "compliant": random.random() < 0.5, "missing": []}
+        return 404, {"detail": "Not Found"}
+
+    def _scan(self, params: dict) -> tuple[int, any]:
+        hostname = params.get("hostname")
+        if not hostname:
+            return 422, {"detail": "hostname is required"}
+        scan_id = str(uuid.uuid4())
+        now = time.monotonic()
+        with self._lock:
+            self._scans[scan_id] = {
+                "hostname": hostname,
+                "port": int(params.get("port") or 443),
+                "submitted": now,
+                "ready": now + self.pending(),
+                "delivered": False,
+            }
+        return 200, {"scan_id": scan_id}
+
+    def _get_result(self, scan_id: str) -> tuple[int, any]:
+        now = time.monotonic()
+        with self._lock:
+            scan = self._scans.get(scan_id)
+            if scan is None:
+                return 404, {"detail": "Scan not found"}
+            if now < scan["ready"]:
+                return 200, []
+            if not scan["delivered"]:
+                scan["delivered"] = True
+                self._latencies.append(now - scan["submitted"])
+        headers = {name: "set" for name in SECURITY_HEADERS if random.random() < 0.6}
+        return 200, [{
+            "scan_id": scan_id,
+            "url": scan["hostname"],
+            "port": scan["port"],
+            "date": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            "score": round(100 * len(headers) / len(SECURITY_HEADERS)),
+            "headers": headers,
+        }]
+
+    def _score(self, body: bytes) -> tuple[int, any]:
+        try:
+            params = json.loads(body or b"{}")
+        except ValueError:
+            return 422, {"detail": "Invalid JSON body"}
+        if not params.get("hostname"):
+            return 422, {"detail": "hostname is required"}
+        headers = [name for name in SECURITY_HEADERS if random.random() < 0.6]
+        return 200, {
+            "hostname": params["hostname"],
+            "port": int(params.get("port") or 443),
+            "security_score": round(100 * len(headers) / len(SECURITY_HEADERS)),
+            "date": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        }
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve a local mock of the Headers Doctor API.')
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Interface to listen on (default 127.0.0.1).')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default {DEFAULT_PORT}).')
+    parser.add_argument('--latency', type=str, default="fixed:0", help='Latency of every request: fixed:S, uniform:MIN:MAX or exp:MEAN (default fixed:0).')
+    parser.add_argument('--pending', type=str, default="uniform:0.5:2", help='How long scans stay pending: fixed:S, uniform:MIN:MAX or exp:MEAN (default uniform:0.5:2).')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests answered with 503 (default 0).')
+    args = parser.parse_args()
+    api = MockHeadersDoctorAPI(args.host, args.port, parse_distribution(args.latency),
+                               parse_distribution(args.pending), args.error_rate)
+    print(f"Mock Headers Doctor API listening on {api.url}")
+    try:
+        api.serve_forever()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import re
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+VALIDATION_CACHE_SIZE = 1 << 16
+
+_HOSTNAME_PATTERN_WITH_SCHEME = re.compile(
+    r"(?i)^(?:(?:https?://)?(?:([a-z0-9-]+|\*)\.)?([a-z0-9-]{1,61})\.([a-z0-9]{2,7}))?$"
+)
+_HOSTNAME_PATTERN = re.compile(r"(?i)^(?:([a-z0-9-]+|\*)\.)?([a-z0-9-]{1,61})\.([a-z0-9]{2,15})$")
+# scheme, host, port and trailing slashes in a single match
+_HOST_LINE_PATTERN = re.compile(r"(?i)^(?:(https?)://)?([^/]*?)(?::(\d+))?/*$")
+_SCHEME_PORTS = {"http": 80, "https": 443}
+
+
+class HostRecord(NamedTuple):
+    host: str
+    port: int | None
+    scheme: str | None
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def validate_hostname(hostname: str) -> bool:
+    """
+    Validates a given hostname.
+
+    Args:
+        hostname (str): The hostname to be validated.
+
+    Returns:
+        bool: True if the hostname is valid, False otherwise.
+    """
+    return bool(_HOSTNAME_PATTERN_WITH_SCHEME.match(hostname) or _HOSTNAME_PATTERN.match(hostname))
+
+
+def parse_host(line: str) -> HostRecord | None:
+    """
+    Parses a URL or a line of a hosts file into a hostname, port and scheme in a single pass.
+
+    An http:// or https:// scheme sets the port to 80 or 443 unless a host:port suffix
+    sets it, and trailing slashes are removed. The hostname is lowercased.
+
+    Args:
+        line (str): The URL or line to be parsed.
+
+    Returns:
+        HostRecord | None: The parsed record, with port None if the line does not set one.
+            Returns None for blank lines and comments. Lines that cannot be parsed, or whose
+            port is not between 1 and 65535, are kept whole as the host, so they fail validation.
+    """
+    line = line.strip()
+    if not line or line[0] == "#":
+        return None
+    match = _HOST_LINE_PATTERN.match(line)
+    if match is None:
+        return HostRecord(line.lower(), None, None)
+    scheme, host, port = match.groups()
+    if scheme:
+        scheme = scheme.lower()
+    if port:
+        port = int(port)
+        if not 0 < port < 65536:
+            return HostRecord(line.lower(), None, None)
+    else:
+        port = _SCHEME_PORTS.get(scheme)
+    return HostRecord(host.lower(), port, scheme)
+
+
+def split_valid(lines: Iterable[str]) -> tuple[list[HostRecord], list[HostRecord]]:
+    """
+    Parses and validates a chunk of lines at once.
+
+    Args:
+        lines (Iterable[str]): The lines to be parsed.
+
+    Returns:
+        tuple[list[HostRecord], list[HostRecord]]: The valid and the invalid records,
+            in the order of the lines. Blank lines and comments are left out.
+    """
+    valid = []
+    invalid = []
+    for record in map(parse_host, lines):
+        if record is None:
+            continue
+        (valid if record.host and validate_hostname(record.host) else invalid).append(record)
+    return valid, invalid
@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import METRICS
+
+DEFAULT_INITIAL_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_DEADLINE = 600.0
+DEFAULT_RATE = 10.0
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter for polling a pending scan.
+
+    Args:
+        initial (float): Delay before the second poll, in seconds.
+        factor (float): Growth of the delay between consecutive polls.
+        maximum (float): Upper bound of the delay, in seconds.
+        jitter (float): Fraction of the delay that is randomized, between 0 and 1.
+    """
+
+    def __init__(self, initial: float = DEFAULT_INITIAL_DELAY, factor: float = 2.0,
+                 maximum: float = DEFAULT_MAX_DELAY, jitter: float = 0.5):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the delay to wait after the given number of pending polls.
+
+        Args:
+            attempt (int): Number of polls that already returned a pending result, starting at 1.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self.maximum, self.initial * self.factor ** max(attempt - 1, 0))
+        return delay * (1 - self.jitter * random.random())
+
+
+def wait_until_ready(fetch, scan_id: str, backoff: Backoff = None, deadline: float = DEFAULT_DEADLINE):
+    """
+    Polls a single scan with backoff until its result is ready, blocking the caller.
+
+    Args:
+        fetch (callable): Function that takes the scan_id and returns the result, or a falsy value while pending.
+        scan_id (str): The id of the scan.
+        backoff (Backoff): Delays between polls. Defaults to Backoff().
+        deadline (float): Seconds after which polling gives up. Defaults to DEFAULT_DEADLINE.
+
+    Returns:
+        any: The result of the scan, or None if the deadline was reached.
+    """
+    backoff = backoff or Backoff()
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        result = fetch(scan_id)
+        if result:
+            return result
+        attempt += 1
+        delay = backoff.delay(attempt)
+        if time.monotonic() + delay > expires:
+            return None
+        time.sleep(delay)
+
+
+async def wait_until_ready_async(fetch, scan_id: str, backoff: Backoff = None, deadline: float = DEFAULT_DEADLINE):
+    """
+    Polls a single scan with backoff until its result is ready, without blocking the event loop.
+
+    Args:
+        fetch (callable): Coroutine function that takes the scan_id and returns the result,
+            or a falsy value while pending.
+        scan_id (str): The id of the scan.
+        backoff (Backoff): Delays between polls. Defaults to Backoff().
+        deadline (float): Seconds after which polling gives up. Defaults to DEFAULT_DEADLINE.
+
+    Returns:
+        any: The result of the scan, or None if the deadline was reached.
+    """
+    backoff = backoff or Backoff()
+    loop = asyncio.get_running_loop()
+    expires = loop.time() + deadline
+    attempt = 0
+    while True:
+        result = await fetch(scan_id)
+        if result:
+            return result
+        attempt += 1
+        delay = backoff.delay(attempt)
+        if loop.time() + delay > expires:
+            return None
+        await asyncio.sleep(delay)
+
+
+class RateBudget:
+    """
+    Spaces requests so that at most `rate` of them start per second.
+
+    Args:
+        rate (float): Requests per second. A value of 0 or less disables the budget.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until the next request may start.
+
+        Returns:
+            None
+        """
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class PollScheduler:
+    """
+    Polls many pending scans from a single timer heap.
+
+    Each scan is polled when it is due; pending scans are pushed back with
+    exponential backoff until they are ready or their deadline passes. A poll that
+    fails with a requests exception, once the session gave up retrying it, is treated
+    like a pending result, so the scan is not lost before its deadline. All polls
+    share a request-rate budget and a limit of polls in flight. Polls, time in queue and
+    polls per scan are recorded in metrics.METRICS.
+
+    Args:
+        fetch (callable): Blocking function that takes a scan_id and returns the result,
+            or a falsy value while the scan is pending. It runs on a pool of `concurrency` threads.
+        on_result (callable): Called with (result, context) when a scan is ready.
+        backoff (Backoff): Delays between polls of the same scan. Defaults to Backoff().
+        deadline (float): Seconds after which a scan is given up. Defaults to DEFAULT_DEADLINE.
+        rate (float): Global polls per second. Defaults to DEFAULT_RATE.
+        concurrency (int): Maximum number of polls in flight. Defaults to 10.
+        on_expired (callable): Called with (scan_id, context) when a scan reaches its deadline.
+    """
+
+    def __init__(self, fetch, on_result, backoff: Backoff = None, deadline: float = DEFAULT_DEADLINE,
+                 rate: float = DEFAULT_RATE, concurrency: int = 10, on_expired=None):
+        self.fetch = fetch
+        self.on_result = on_result
+        self.on_expired = on_expired
+        self.backoff = backoff or Backoff()
+        self.deadline = deadline
+        self.budget = RateBudget(rate)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._heap = []
+        self._counter = itertools.count()
+        self._in_flight = set()
+        self._wakeup = asyncio.Event()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._heap) + len(self._in_flight)
+
+    def add(self, scan_id: str, context: any = None):
+        """
+        Schedules a scan to be polled right away.
+
+        Args:
+            scan_id (str): The id of the scan.
+            context (any): Value handed back to on_result, e.g. the port. Defaults to None.
+
+        Returns:
+            None
+        """
+        now = asyncio.get_running_loop().time()
+        self._push(now, scan_id, context, 0, now + self.deadline)
+
+    def close(self):
+        """
+        Signals that no more scans will be added, so run() returns once every scan is resolved.
+
+        Returns:
+            None
+        """
+        self._closed = True
+        self._wakeup.set()
+
+    def _push(self, due: float, scan_id: str, context: any, attempt: int, expires: float):
+        heapq.heappush(self._heap, (due, next(self._counter), scan_id, context, attempt, expires))
+        self._wakeup.set()
+
+    async def _sleep(self, timeout: float = None):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        """
+        Polls scheduled scans until close() was called and none are left.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not self._heap:
+                    if self._closed and not self._in_flight:
+                        return
+                    await self._sleep()
+                    continue
+                delay = self._heap[0][0] - loop.time()
+                if delay > 0:
+                    await self._sleep(delay)
+                    continue
+                entry = heapq.heappop(self._heap)
+                await self._slots.acquire()
+                await self.budget.acquire()
+                task = asyncio.create_task(self._poll(*entry[2:]))
+                self._in_flight.add(task)
+        finally:
+            for task in self._in_flight:
+                task.cancel()
+            self._executor.shutdown(wait=False)
+
+    async def _poll(self, scan_id: str, context: any, attempt: int, expires: float):
+        import requests
+        logger = logging.getLogger(__name__)
+        loop = asyncio.get_running_loop()
+        try:
+            METRICS.inc("polls")
+            try:
+                result = await loop.run_in_executor(self._executor, self.fetch, scan_id)
+            except requests.exceptions.RequestException as e:
+                METRICS.inc("poll_errors")
+                logger.warning(f"Polling {scan_id} failed, it will be polled again. Error: {e}")
+                result = None
+            if result:
+                METRICS.inc("results_done")
+                METRICS.observe("time_in_queue_seconds", loop.time() - (expires - self.deadline))
+                METRICS.observe("polls_per_scan", attempt + 1)
+                self.on_result(result, context)
+                return
+            attempt += 1
+            due = loop.time() + self.backoff.delay(attempt)
+            if due > expires:
+                METRICS.inc("results_expired")
+                logger.warning(f"Result for {scan_id} was not ready after {attempt} polls")
+                if self.on_expired:
+                    self.on_expired(scan_id, context)
+            else:
+                self._push(due, scan_id, context, attempt, expires)
+        except Exception as e:
+            METRICS.inc("poll_errors")
+            logger.error(f"It was not possible to get the result for {scan_id}. Error: {e}")
+        finally:
+            self._in_flight.discard(asyncio.current_task())
+            self._slots.release()
+            self._wakeup.set()
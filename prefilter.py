@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import METRICS
+
+DEFAULT_PORTS = (443, 80)
+DEFAULT_TIMEOUT = 3.0
+DEFAULT_CONCURRENCY = 100
+DEFAULT_RESOLVER_CACHE_SIZE = 100000
+DEFAULT_RESOLVER_WORKERS = 32
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def parse_ports(value: str) -> tuple[int, ...]:
+    """
+    Parses a comma-separated list of ports, e.g. "443,80".
+
+    Raises:
+        ValueError: If a port is not valid.
+    """
+    ports = tuple(int(port) for port in value.split(",") if port.strip())
+    if not ports or any(not 0 < port < 65536 for port in ports):
+        raise ValueError(f"Invalid ports {value}")
+    return ports
+
+
+class Resolver:
+    """
+    Resolves hostnames without blocking the event loop, caching the addresses of the
+    last `cache_size` hostnames, failures included.
+
+    The blocking getaddrinfo calls run on a pool of `workers` threads of its own, so DNS
+    lookups do not compete with the other work of the default executor. Concurrent
+    lookups of the same hostname share a single call.
+
+    Args:
+        cache_size (int): Maximum number of cached hostnames. Defaults to DEFAULT_RESOLVER_CACHE_SIZE.
+        workers (int): Maximum number of lookups in flight. Defaults to DEFAULT_RESOLVER_WORKERS.
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_RESOLVER_CACHE_SIZE, workers: int = DEFAULT_RESOLVER_WORKERS):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def resolve(self, host: str) -> list[str]:
+        """
+        Returns the IP addresses of a hostname.
+
+        Args:
+            host (str): The normalized hostname.
+
+        Returns:
+            list[str]: The addresses, empty if the hostname does not resolve.
+        """
+        if host in self._cache:
+            self._cache.move_to_end(host)
+            return self._cache[host]
+        if host not in self._pending:
+            self._pending[host] = asyncio.ensure_future(self._lookup(host))
+        try:
+            addresses = await asyncio.shield(self._pending[host])
+        finally:
+            self._pending.pop(host, None)
+        self._cache[host] = addresses
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return addresses
+
+    async def _lookup(self, host: str) -> list[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            with METRICS.timer("resolve_seconds"):
+                infos = await loop.run_in_executor(self._executor, socket.getaddrinfo, host, None, 0, socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            return []
+        # Keep the resolver order, which prefers the address family the system would use first
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+def get_resolver() -> Resolver:
+    """
+    Returns the resolver shared by every prefilter, creating it on first use.
+    """
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = Resolver()
+    return _resolver
+
+
+class Prefilter:
+    """
+    Finds the live port of a host before it is submitted, with a DNS lookup and TCP connect probes.
+
+    The candidate ports are probed concurrently and the first one in order that accepts
+    a connection is chosen, so a host that only answers on 80 is submitted once on 80
+    instead of failing on 443 first. Hosts that do not resolve or accept no connection
+    are dropped without any API request.
+
+    Args:
+        ports (tuple[int, ...]): Candidate ports of the hosts without one, in order of preference.
+            Defaults to DEFAULT_PORTS.
+        timeout (float): Seconds a connection attempt may take. Defaults to DEFAULT_TIMEOUT.
+        concurrency (int): Maximum number of hosts being checked at once. Defaults to DEFAULT_CONCURRENCY.
+        resolver (Resolver): The resolver. Defaults to the shared one.
+    """
+
+    def __init__(self, ports: tuple[int, ...] = DEFAULT_PORTS, timeout: float = DEFAULT_TIMEOUT,
+                 concurrency: int = DEFAULT_CONCURRENCY, resolver: Resolver = None):
+        self.ports = ports
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.resolver = resolver or get_resolver()
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def candidates(self, port: int = None) -> tuple[int, ...]:
+        """
+        Returns the ports to probe: the given one first, then the other candidate ports.
+        """
+        return tuple(dict.fromkeys(((port,) if port else ()) + self.ports))
+
+    async def _connect(self, addresses: list[str], port: int) -> bool:
+        # A host with several addresses is reachable if one of the first two accepts the connection
+        for address in addresses[:2]:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), self.timeout)
+            except (OSError, OverflowError, ValueError, asyncio.TimeoutError):
+                continue
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return True
+        return False
+
+    async def check(self, host: str, ports: tuple[int, ...]) -> int | None:
+        """
+        Returns the first of the given ports on which a host accepts a TCP connection.
+
+        Args:
+            host (str): The normalized hostname.
+            ports (tuple[int, ...]): The ports to probe, in order of preference.
+
+        Returns:
+            int | None: The live port, or None if the host does not resolve or accepts no connection.
+        """
+        logger = logging.getLogger(__name__)
+        async with self._slots:
+            addresses = await self.resolver.resolve(host)
+            if not addresses:
+                METRICS.inc("hosts_unresolved")
+                logger.info(f"{host} does not resolve")
+                return None
+            with METRICS.timer("probe_seconds"):
+                reachable = await asyncio.gather(*(self._connect(addresses, port) for port in ports))
+        for port, live in zip(ports, reachable):
+            if live:
+                return port
+        METRICS.inc("hosts_unreachable")
+        logger.info(f"{host} accepts no connection on {', '.join(map(str, ports))}")
+        return None
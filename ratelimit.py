@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BASE = 0.5
+DEFAULT_RETRY_CAP = 30.0
+DEFAULT_BREAKER_THRESHOLD = 10
+DEFAULT_BREAKER_COOLDOWN = 30.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` requests per second with bursts of up to `burst`.
+
+    Args:
+        rate (float): Tokens added per second. A value of 0 or less disables the limit.
+        burst (float): Maximum number of tokens. Defaults to `rate`, and at least 1.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+
+        Returns:
+            None
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: callers reserve their slot and sleep outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Pauses every request for `cooldown` seconds after `threshold` consecutive server failures.
+
+    Args:
+        threshold (int): Consecutive failures that open the breaker. Defaults to DEFAULT_BREAKER_THRESHOLD.
+        cooldown (float): Seconds the breaker stays open. Defaults to DEFAULT_BREAKER_COOLDOWN.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_BREAKER_THRESHOLD, cooldown: float = DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Sleeps while the breaker is open.
+
+        Returns:
+            None
+        """
+        delay = self._open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold and self._open_until <= time.monotonic():
+                self._open_until = time.monotonic() + self.cooldown
+
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with jitter. A Retry-After header sent by the API takes
+    precedence over the backoff and is not capped.
+
+    Args:
+        max_retries (int): Retries after the first attempt. Defaults to DEFAULT_MAX_RETRIES.
+        base (float): Delay before the first retry, in seconds. Defaults to DEFAULT_RETRY_BASE.
+        cap (float): Maximum delay between retries, in seconds. Defaults to DEFAULT_RETRY_CAP.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base: float = DEFAULT_RETRY_BASE,
+                 cap: float = DEFAULT_RETRY_CAP):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Returns the delay before the given retry.
+
+        Args:
+            attempt (int): The retry number, starting at 1.
+            retry_after (str): The Retry-After header of the response, in seconds or as an HTTP date. Defaults to None.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+            import email.utils
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
@@ -1,31 +1,169 @@
 import datetime
 import os
-import re
-import requests
+import sys
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL, ResultCache
+from codec import ResultRecord, as_record, decode_result, dumps, loads
+from fingerprints import FingerprintStore
+from store import GROUP_BY, ResultStore
+from ingest import read_hosts
+from metrics import METRICS, count_lines, report_progress
+from journal import DONE, FAILED, PENDING, SUBMITTED, JournalState, ScanJournal
+from normalize import parse_host, validate_hostname
+from ratelimit import (DEFAULT_BREAKER_COOLDOWN, DEFAULT_BREAKER_THRESHOLD, DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES,
+                       DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, CircuitBreaker, RetryPolicy)
+from sharding import merge_shards, parse_shard, run_shards, shard_file, shard_name, shard_of
+from prefilter import (DEFAULT_CONCURRENCY as DEFAULT_PREFILTER_CONCURRENCY, DEFAULT_PORTS as DEFAULT_PREFILTER_PORTS,
+                       DEFAULT_TIMEOUT as DEFAULT_PREFILTER_TIMEOUT, Prefilter, parse_ports)
+from poller import DEFAULT_DEADLINE, DEFAULT_RATE, PollScheduler, wait_until_ready
+from writers import OUTPUT_FORMATS, DiffSink, LineWriter, MultiSink, PrintSink, ResultWriter, ScoreWriter, open_sink
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-# create a file handler which logs even debug messages
-fh = logging.FileHandler('scan_headers.log')
-fh.setLevel(logging.DEBUG)
+API_HEADERS_DOCTOR = "https://api.headers.doctor"
+DEFAULT_CONCURRENCY = 10
+DEFAULT_RESULT_WORKERS = 10
 
-# create a console handler with a higher log level
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
+# scan_file submits from worker threads, so opening the temp files is serialized
+_temp_files_lock = threading.Lock()
+_temp_files = {}
+_result_cache = None
+_result_writer = None
+_fingerprints = None
+_log_handlers = None
 
-# create a formatter and set the formatter for the handlers
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s - %(message)s', datefmt='%d-%b-%Y %H:%M:%S')
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
+def setup_logging(level: str = "INFO", console_level: str = None):
+    """
+    Logs the messages of every module to the console and to scan_headers.log.
 
-# add the handlers to the logger
-logger.addHandler(fh)
-logger.addHandler(ch)
+    It is called by the command line entry point, so importing this module opens no
+    file and attaches no handler. Calling it again only changes the levels.
 
-API_HEADERS_DOCTOR = "https://api.headers.doctor"
+    Args:
+        level (str): Level of the messages logged. Defaults to "INFO".
+        console_level (str): Level of the messages logged to the console, if higher. Defaults to `level`.
+
+    Returns:
+        None
+    """
+    global _log_handlers
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _log_handlers is None:
+        # create a file handler which logs even debug messages
+        fh = logging.FileHandler('scan_headers.log')
+        fh.setLevel(logging.DEBUG)
+        # create a console handler with a higher log level
+        ch = logging.StreamHandler()
+        # create a formatter and set the formatter for the handlers
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s - %(message)s', datefmt='%d-%b-%Y %H:%M:%S')
+        fh.setFormatter(formatter)
+        ch.setFormatter(formatter)
+        # add the handlers to the root logger, so the messages of every module are logged
+        root.addHandler(fh)
+        root.addHandler(ch)
+        _log_handlers = (fh, ch)
+    _log_handlers[1].setLevel(console_level or level)
+
+def configure_writer(path: str = None, output_format: str = "dir", store: str = None,
+                     fingerprints: FingerprintStore = None):
+    """
+    Starts the background writer of the results, or stops it if no path, store or fingerprints are given.
+
+    Args:
+        path (str): The path to the directory where the results will be saved. Defaults to None.
+        output_format (str): One of writers.OUTPUT_FORMATS. Defaults to "dir".
+        store (str): The path to a SQLite results store where the results are saved too. Defaults to None.
+        fingerprints (FingerprintStore): If given, as returned by configure_diff, only the results
+            whose posture changed are written to `path`, or printed if there is no path.
+            The store still gets every result, so its queries see unchanged hosts too. Defaults to None.
+
+    Returns:
+        ResultWriter | None: The writer, or None if it is stopped.
+    """
+    global _result_writer
+    if _result_writer is not None:
+        _result_writer.close()
+    output = open_sink(path, output_format) if path else None
+    if fingerprints is not None:
+        output = DiffSink(output if output is not None else PrintSink(), fingerprints)
+    # The store is written before the diff, it keeps every observation
+    sinks = ([ResultStore(store)] if store else []) + ([output] if output is not None else [])
+    sink = sinks[0] if len(sinks) == 1 else MultiSink(sinks)
+    _result_writer = ResultWriter(sink) if sinks else None
+    return _result_writer
+
+def _temp_file(path: str) -> LineWriter:
+    """
+    Returns the writer of a temp file, opening it on first use and keeping it open for the run.
+
+    Args:
+        path (str): The path to the temp file.
+
+    Returns:
+        LineWriter: The writer.
+    """
+    with _temp_files_lock:
+        if path not in _temp_files:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _temp_files[path] = LineWriter(path)
+        return _temp_files[path]
+
+def close_temp_files():
+    """
+    Closes the temp files opened by save_uuid and save_not_valid_url.
+
+    Returns:
+        None
+    """
+    with _temp_files_lock:
+        for writer in _temp_files.values():
+            writer.close()
+        _temp_files.clear()
+
+def configure_cache(path: str = None, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_SIZE):
+    """
+    Enables the local result cache, or disables it if no path is given.
+
+    While it is enabled, hosts with a fresh cached result are not submitted again and
+    every result fetched from the API is stored in it.
+
+    Args:
+        path (str): The path to the SQLite cache file. Defaults to None.
+        ttl (float): Seconds a cached result stays fresh. Defaults to DEFAULT_CACHE_TTL.
+        max_entries (int): Maximum number of cached results. Defaults to DEFAULT_CACHE_SIZE.
+
+    Returns:
+        ResultCache | None: The cache, or None if it is disabled.
+    """
+    global _result_cache
+    if _result_cache is not None:
+        _result_cache.close()
+    _result_cache = ResultCache(path, ttl, max_entries) if path else None
+    return _result_cache
+
+def configure_diff(path: str = None):
+    """
+    Enables the incremental diff mode, or disables it if no path is given.
+
+    The store is meant for configure_writer: its writer then only saves or prints the
+    results whose header posture changed since the previous run, and records their
+    fingerprints once they are written.
+
+    Args:
+        path (str): The path to the SQLite file with the fingerprints of the previous runs. Defaults to None.
+
+    Returns:
+        FingerprintStore | None: The store, or None if it is disabled.
+    """
+    global _fingerprints
+    if _fingerprints is not None:
+        _fingerprints.close()
+    _fingerprints = FingerprintStore(path) if path else None
+    return _fingerprints
 
 def save_uuid(uuid: str, port:int, temp: str):
     """
@@ -40,8 +178,7 @@ def save_uuid(uuid: str, port:int, temp: str):
     """
     try:
         logger = logging.getLogger(__name__)
-        with open(f"{temp}/uuids.txt", "a") as f:
-            f.write(f"{uuid}:{port}\n")
+        _temp_file(f"{temp}/uuids.txt").write(f"{uuid}:{port}")
     except FileNotFoundError as e:
         logger.error(f"Error: {e}")
     except Exception as e:
@@ -60,11 +197,7 @@ def save_not_valid_url(url: str, port: int, temp: str):
     """
     try:
         logger = logging.getLogger(__name__)
-        path = f"{temp}/not_valid_urls.txt"
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
-        with open(path, "a") as f:
-            f.write(f"{url}:{port}\n")
+        _temp_file(f"{temp}/not_valid_urls.txt").write(f"{url}:{port}")
     except FileNotFoundError as e:
         logger.error(f"Error: {e}")
     except Exception as e:
@@ -72,10 +205,10 @@ def save_not_valid_url(url: str, port: int, temp: str):
         
 def save_scan_result(response: any, path: str):
     """
-    Saves a given response to a JSON file in the given path.
+    Saves a given response to a JSON file in the given path, with the bytes returned by the API.
 
     Args:
-        response (any): The response to be saved.
+        response (any): The response to be saved, a ResultRecord or the list returned by the API.
         path (str): The path to the directory where the file will be saved.
 
     Returns:
@@ -83,10 +216,10 @@ def save_scan_result(response: any, path: str):
     """
     try:
         logger = logging.getLogger(__name__)
-        response = response[0]
-        url = response['url']
-        port = response['port']
-        date_time = response['date']
+        response = as_record(response)
+        url = response.url
+        port = response.port
+        date_time = response.date
         
         # if not os.path.exists(path):
         directory = os.path.join(path, f"{url}_{port}")
@@ -96,9 +229,8 @@ def save_scan_result(response: any, path: str):
         
         file_path = os.path.join(directory, f"{date_time}.json")
         
-        with open(file_path, "w") as f:
-            import json
-            json.dump(response, f, indent=4)
+        with open(file_path, "wb") as f:
+            f.write(response.raw)
     except ValueError as e:
         logger.error(f"Error: {e}")
     except FileNotFoundError as e:
@@ -138,9 +270,11 @@ def scan_url(url, port):
     Returns:
         dict: The result of the scan.
     """
+    import requests
+    from http_session import get_session
     try:
         logger = logging.getLogger(__name__)
-        response = requests.post(
+        response = get_session().post(
             f"{API_HEADERS_DOCTOR}/results/scan-hostname",
             headers={'Content-Type': 'application/json',},
             params={
@@ -150,7 +284,7 @@ def scan_url(url, port):
         )
         if response.status_code == 200:
             logger.info(f"Request queued for scan {url}:{port}. Status code: {response.status_code}")
-            return response.json()
+            return loads(response.content)
         else:
             logger.error(f"It was not possible to queue {url}:{port}. Status code: {response.status_code}")
             return None
@@ -161,28 +295,128 @@ def scan_url(url, port):
         logger.error(f"It was not possible to queue {url}:{port}. Error: {e}")
     return None
 
-def validate_hostname(hostname: str) -> bool:
+def score_url(url: str, port: int = 0) -> dict | None:
     """
-    Validates a given hostname.
+    Gets the security score of a given URL and port right away, without queuing a scan.
 
     Args:
-        hostname (str): The hostname to be validated.
+        url (str): The normalized URL to be scored.
+        port (int): The port associated with the URL, 0 for the default. Defaults to 0.
 
     Returns:
-        bool: True if the hostname is valid, False otherwise.
+        dict | None: The response, with security_score and date, or None if it failed.
     """
+    import requests
+    from http_session import get_session
     try:
         logger = logging.getLogger(__name__)
-        pattern1 = r"(?i)^(?:(?:https?://)?(?:([a-z0-9-]+|\*)\.)?([a-z0-9-]{1,61})\.([a-z0-9]{2,7}))?$"
-        pattern2 = r"(?i)^(?:([a-z0-9-]+|\*)\.)?([a-z0-9-]{1,61})\.([a-z0-9]{2,15})$"
-        if re.match(pattern1, hostname):
-            return True
-        if re.match(pattern2, hostname):
-            return True
-        return False
+        response = get_session().post(
+            f"{API_HEADERS_DOCTOR}/results/scores",
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+            data=dumps({
+                "hostname": url,
+                "hidden": False,
+                "port": port,
+                "redirects": False,
+                "date": datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z",
+            }),
+        )
+        if response.status_code == 200:
+            return loads(response.content)
+        logger.error(f"It was not possible to score {url}:{port}. Status code: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"It was not possible to score {url}:{port}. Request exception: {e}")
     except Exception as e:
-        logger.error(f"(validate_hostname) Error: {e}")
-    return False
+        logger.error(f"It was not possible to score {url}:{port}. Error: {e}")
+    return None
+
+async def score_hosts(file_path: str = None, url: str = None, output: str = None, port: int = None,
+                      concurrency: int = DEFAULT_CONCURRENCY, shard: tuple[int, int] = None):
+    """
+    Gets the security score of a URL or of every host of a file, streaming host, port, score and date rows.
+
+    The blocking requests run on a thread pool with at most `concurrency` in flight,
+    sharing the pooled session. No scan is queued and no result is polled. A host that
+    fails is logged and skipped; if the rows are piped to stdout and the reader goes
+    away, e.g. `| head`, scoring stops quietly.
+
+    Args:
+        file_path (str): The path to the file with the hosts to be scored. Defaults to None.
+        url (str): A single URL to be scored if no file is given. Defaults to None.
+        output (str): The CSV or .jsonl file the rows are appended to. Defaults to CSV on stdout.
+        port (int): The port used for the hosts that do not set one. If 0 or None, "port": 0 is sent,
+            like get_headers_score.sh, and the API picks the port. Defaults to None.
+        concurrency (int): Maximum number of requests in flight. Defaults to DEFAULT_CONCURRENCY.
+        shard (tuple[int, int]): If given as (index, shards), only the hosts of that shard are scored. Defaults to None.
+
+    Returns:
+        None
+    """
+    logger = logging.getLogger(__name__)
+    writer = ScoreWriter(output)
+    stopped = threading.Event()
+
+    def score(host: str, host_port: int = None):
+        """
+        Scores a single host, logging any error so one bad host does not stop the batch.
+        """
+        if stopped.is_set():
+            return
+        _port = host_port if host_port is not None else port or 0
+        METRICS.track("submissions_in_flight", 1)
+        try:
+            with METRICS.timer("score_seconds"):
+                response = score_url(host, _port)
+            if response is not None:
+                writer.write(host, response.get('port') or _port, response.get('security_score'), response.get('date'))
+                METRICS.inc("results_done")
+                return
+        except BrokenPipeError:
+            stopped.set()
+            return
+        except Exception as e:
+            logger.error(f"It was not possible to score {host}:{_port}. Error: {e}")
+        finally:
+            METRICS.track("submissions_in_flight", -1)
+        METRICS.inc("submit_failed")
+
+    def on_invalid(record):
+        logger.error(f"Invalid URL {record.host}")
+        METRICS.inc("submit_failed")
+
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    def on_done(task):
+        tasks.discard(task)
+        in_flight.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if file_path:
+                hosts = read_hosts(file_path, None, on_invalid, shard=shard)
+            else:
+                record = parse_host(url)
+                hosts = [record] if record is not None and validate_hostname(record.host) else []
+                if not hosts:
+                    logger.warning("Invalid URL")
+            for host, host_port, _ in hosts:
+                await in_flight.acquire()
+                if stopped.is_set():
+                    break
+                task = loop.run_in_executor(executor, score, host, host_port)
+                tasks.add(task)
+                task.add_done_callback(on_done)
+            if tasks:
+                await asyncio.gather(*tasks)
+    finally:
+        writer.close()
+    if stopped.is_set():
+        logger.info("The reader of the scores went away, stopping")
+        # Python flushes stdout again on exit, which would raise BrokenPipeError once more
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
 def format_url(url: str, port: int = 443) -> tuple[dict, int] | None:
     """
     Formats a given URL and port and returns the result of scanning the URL.
@@ -197,69 +431,76 @@ def format_url(url: str, port: int = 443) -> tuple[dict, int] | None:
     """
     try:
         logger = logging.getLogger(__name__)
-        if not validate_hostname(url):
+        record = parse_host(url)
+        if record is None or not record.host or not validate_hostname(record.host):
             logger.error("Error: Invalid URL")
             return None
-        if url.endswith('/'):
-                url = url[:-1]
+        url = record.host
+        if record.port is not None:
+            port = record.port
 
-        if url.startswith("http://"):
-            port = 80
-            url = url.replace("http://", "")
-        
-        if url.startswith("https://"):
-            port = 443
-            url = url.replace("https://", "")
+        scan_id = _result_cache.get(url, port) if _result_cache is not None else None
+        if scan_id is not None:
+            METRICS.inc("cache_hits")
+            logger.info(f"Using cached result for {url}:{port}")
+            return {"scan_id": scan_id}, port
         
         return scan_url(url, port), port
         
     except ValueError as e:
         logger.error(f"Error: {e}")
 
-async def scan_file(file_path: str, temp:str, port: int = None):
+async def scan_file(file_path: str, temp:str, port: int = None, concurrency: int = DEFAULT_CONCURRENCY,
+                    on_queued=None, journal: ScanJournal = None, skip=None, shard: tuple[int, int] = None,
+                    prefilter: Prefilter = None):
     """
     Scans a given file and writes the results to a file or saves them in a temporary file.
 
+    The file is read lazily and every host is normalized and submitted once. The blocking
+    submissions run on a thread pool, keeping at most `concurrency` requests in flight at any time.
+
+    With a prefilter, every host is first resolved and probed on its candidate ports. Hosts
+    that do not resolve or accept no connection are dropped before any request to the API,
+    and the others are submitted once on the live port.
+
     Args:
         file_path (str): The path to the file to be scanned.
-        port (int): The port associated with the URL. Defaults to None.
+        port (int): The port used for the hosts that do not set one with a scheme or a
+            host:port suffix. If None, 443 is tried and then 80. Defaults to None.
+        concurrency (int): Maximum number of submissions in flight. Defaults to DEFAULT_CONCURRENCY.
+        on_queued (callable): If given, it is called with (scan_id, host, port) on the event loop
+            as soon as each submission returns. Defaults to None.
+        journal (ScanJournal): If given, every host is recorded in it as submitted or failed. Defaults to None.
+        skip (callable): If given, hosts for which skip(host, port) is true are not submitted. Defaults to None.
+        shard (tuple[int, int]): If given as (index, shards), only the hosts of that shard are scanned. Defaults to None.
+        prefilter (Prefilter): If given, the hosts are checked with it before being submitted. Defaults to None.
 
     Returns:
         None
     """
     logger = logging.getLogger(__name__)
-    logger.info(f"Scanning file {file_path}")
+    logger.info(f"Scanning file {file_path}" + (f" (shard {shard[0]}/{shard[1]})" if shard else ""))
     # Almacenar temporalmente los uuids en un archivo
     # Almacenar temporalmente las urls que no funcionan en otro archiv
     def in_case_no_port(url: str):
         """
-        Scans a given URL without a port and writes the result to a file or saves it in a temporary file.
+        Scans a given URL without a port on 443, or on 80 if that fails, and writes the result
+        to a file or saves it in a temporary file.
 
         Args:
-            url (str): The URL to be scanned.
+            url (str): The normalized URL to be scanned.
 
         Returns:
-            None
+            tuple[dict, int]: The response of the submission (None if it failed) and the port used.
         """
         logger.info(f"Scanning {url}")
-        if ":" in url:
-            port = int(url.split(":")[1])
-            url = url.split(":")[0]
-            response, _ = format_url(url, port)
-            write_response(response, temp, url, port)                
-                
-        elif url.startswith("http://") or url.startswith("https://"):
-            response, _port = format_url(url)
-            write_response(response, temp, url, _port)
-        else:
-            port = 443
-            response, _ = format_url(url, port)
-            if response is not None:
-                save_uuid(response['uuid'])
-            else:
-                port = 80
-                response, _ = format_url(url, port)
-                write_response(response, temp, url, port)
+        port = 443
+        response, _ = format_url(url, port) or (None, port)
+        if response is None:
+            port = 80
+            response, _ = format_url(url, port) or (None, port)
+        write_response(response, temp, url, port)
+        return response, port
     
     def with_port(url:str, port:int):
         """
@@ -270,20 +511,286 @@ async def scan_file(file_path: str, temp:str, port: int = None):
             port (int): The port associated with the URL.
         
         Returns:
-            None
+            tuple[dict, int]: The response of the submission (None if it failed) and the port used.
         """
-        response, _ = format_url(url, port)
+        response, _ = format_url(url, port) or (None, port)
         write_response(response, temp, url, port)
+        return response, port
+
+    def on_invalid(record):
+        logger.error(f"Invalid URL {record.host}")
+        save_not_valid_url(record.host, record.port or port, temp)
+        if journal is not None:
+            journal.record(FAILED, record.host, record.port or port)
     
-    with open(file_path, 'r') as file:
-        for line in file:
-            url = line.strip()
-            if port is None:
-                in_case_no_port(url)
+    def submit(url: str, url_port: int = None):
+        """
+        Submits a single host of the file, logging any error so one bad host does not stop the batch.
+
+        Args:
+            url (str): The normalized URL to be scanned.
+            url_port (int): The port set in the file for this URL. Defaults to None.
+
+        Returns:
+            tuple[str, str, int] | None: The scan_id, URL and port of the queued scan, or None if it was not queued.
+        """
+        _port = url_port if url_port is not None else port
+        METRICS.track("submissions_in_flight", 1)
+        try:
+            with METRICS.timer("submit_seconds"):
+                if _port is None:
+                    response, _port = in_case_no_port(url)
+                else:
+                    response, _port = with_port(url, _port)
+            if response is not None:
+                METRICS.inc("submitted")
+                if journal is not None:
+                    journal.record(SUBMITTED, url, _port, response['scan_id'])
+                return response['scan_id'], url, _port
+        except Exception as e:
+            logger.error(f"It was not possible to scan {url}. Error: {e}")
+        finally:
+            METRICS.track("submissions_in_flight", -1)
+        METRICS.inc("submit_failed")
+        if journal is not None:
+            journal.record(FAILED, url, _port)
+        return None
+
+    async def prefiltered(url: str, url_port: int = None):
+        """
+        Submits a host of the file on its live port, or drops it if the prefilter finds none.
+
+        Like submit, it logs any error so one bad host does not stop the batch.
+        """
+        ports = (url_port,) if url_port is not None else prefilter.candidates(port)
+        try:
+            live_port = await prefilter.check(url, ports)
+        except Exception as e:
+            logger.error(f"It was not possible to prefilter {url}. Error: {e}")
+            METRICS.inc("submit_failed")
+            live_port = None
+        if live_port is None:
+            save_not_valid_url(url, ports[0], temp)
+            if journal is not None:
+                journal.record(FAILED, url, ports[0])
+            return None
+        return await loop.run_in_executor(executor, submit, url, live_port)
+
+    loop = asyncio.get_running_loop()
+    # The probes are cheap next to the submissions, so the window makes room for both
+    in_flight = asyncio.Semaphore(concurrency + (prefilter.concurrency if prefilter is not None else 0))
+    tasks = set()
+
+    def on_done(task):
+        tasks.discard(task)
+        in_flight.release()
+        if on_queued is not None and not task.cancelled() and task.result() is not None:
+            on_queued(*task.result())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # The prefilter chooses the port of the hosts that do not set one, so it is not filled in here
+        for url, url_port, _ in read_hosts(file_path, port if prefilter is None else None, on_invalid, shard=shard):
+            if skip is not None and (skip(url, url_port) if prefilter is None or url_port is not None
+                                     else any(skip(url, _port) for _port in prefilter.candidates(port))):
+                METRICS.inc("hosts_skipped")
+                continue
+            # Waiting here keeps the window bounded instead of reading the whole file into tasks
+            await in_flight.acquire()
+            if prefilter is None:
+                task = loop.run_in_executor(executor, submit, url, url_port)
             else:
-                with_port(url, port)
+                task = asyncio.ensure_future(prefiltered(url, url_port))
+            tasks.add(task)
+            task.add_done_callback(on_done)
+        if tasks:
+            await asyncio.gather(*tasks)
                 
-async def get_result(path: str=None, uuid: str=None, temp: str=None, uuid_file: str=None) -> None:
+def fetch_result(uuid: str) -> ResultRecord | None:
+    """
+    Requests the result of a scan once, or takes it from the result cache if it is there.
+
+    The response is decoded once; the record keeps its bytes so they are saved without being encoded again.
+
+    Args:
+        uuid (str): The UUID of the scan.
+
+    Returns:
+        ResultRecord | None: The result of the scan, or None if it is not ready yet.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails or the API returns an error status.
+    """
+    from http_session import get_session
+    if _result_cache is not None:
+        result = _result_cache.get_result(uuid)
+        if result:
+            return result
+    response = get_session().get(
+        f"{API_HEADERS_DOCTOR}/results/get_result/{uuid}",
+        headers={"Accept": "application/json"}
+    )
+    response.raise_for_status()
+    result = decode_result(response.content)
+    if result is None:
+        return None
+    if _result_cache is not None:
+        _result_cache.put(result)
+    return result
+
+def output_result(result: ResultRecord, path: str = None, temp: str = None):
+    """
+    Saves a result in the given path or prints it if no path is given.
+
+    If the result writer was started with configure_writer, the result is queued to it instead,
+    and in diff mode it skips the results whose posture did not change.
+
+    Args:
+        result (ResultRecord): The result of the scan.
+        path (str): The path to the directory where the result will be saved. Defaults to None.
+
+    Returns:
+        None
+    """
+    result = as_record(result)
+    if _result_writer is not None:
+        _result_writer.write(result)
+    elif path:
+        write_response(result, temp=temp, path=path)
+    else:
+        print([result.data])
+
+def wait_for_result(uuid: str, path: str = None, temp: str = None, deadline: float = DEFAULT_DEADLINE):
+    """
+    Polls the result of a scan with backoff until it is ready and saves or prints it.
+
+    Args:
+        uuid (str): The UUID of the scan.
+        path (str): The path to the directory where the result will be saved. Defaults to None.
+        deadline (float): Seconds after which polling gives up. Defaults to DEFAULT_DEADLINE.
+
+    Returns:
+        None
+    """
+    import requests
+    logger = logging.getLogger(__name__)
+    logger.info(f"Getting result for {uuid}")
+    try:
+        result = wait_until_ready(fetch_result, uuid, deadline=deadline)
+        if result:
+            output_result(result, path, temp)
+        else:
+            logger.warning(f"Result for {uuid} was not ready after {deadline} seconds")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"It was not possible to get the result for {uuid}. Request exception: {e}")
+
+async def scan_pipeline(file_path: str, temp: str, port: int = None, path: str = None,
+                        concurrency: int = DEFAULT_CONCURRENCY, workers: int = DEFAULT_RESULT_WORKERS,
+                        deadline: float = DEFAULT_DEADLINE, rate: float = DEFAULT_RATE,
+                        journal: ScanJournal = None, resume: JournalState = None, shard: tuple[int, int] = None,
+                        prefilter: Prefilter = None):
+    """
+    Scans a given file and gets the results in the same run.
+
+    Every scan_id returned while submitting is handed to a poll scheduler, so results
+    are fetched while the rest of the file is still being submitted.
+
+    When resuming, the hosts that were done or still in flight in the journaled run are
+    not submitted again, and the scans in flight are polled again.
+
+    Args:
+        file_path (str): The path to the file to be scanned.
+        port (int): The port associated with the URL. Defaults to None.
+        path (str): The path to the directory where the results will be saved. Defaults to None.
+        concurrency (int): Maximum number of submissions in flight. Defaults to DEFAULT_CONCURRENCY.
+        workers (int): Maximum number of result polls in flight. Defaults to DEFAULT_RESULT_WORKERS.
+        deadline (float): Seconds after which a pending scan is given up. Defaults to DEFAULT_DEADLINE.
+        rate (float): Maximum result polls per second. Defaults to DEFAULT_RATE.
+        journal (ScanJournal): If given, the state of every host is recorded in it. Defaults to None.
+        resume (JournalState): The state of a previous run to resume. Defaults to None.
+        shard (tuple[int, int]): If given as (index, shards), only the hosts of that shard are scanned. Defaults to None.
+        prefilter (Prefilter): If given, the hosts are checked with it before being submitted. Defaults to None.
+
+    Returns:
+        None
+    """
+    logger = logging.getLogger(__name__)
+
+    def on_result(result, host_port):
+        output_result(result, path, temp)
+        if journal is not None:
+            journal.record(DONE, *host_port)
+
+    def on_expired(scan_id, host_port):
+        if journal is not None:
+            journal.record(PENDING, *host_port, scan_id)
+
+    scheduler = PollScheduler(
+        fetch_result,
+        on_result,
+        deadline=deadline,
+        rate=rate,
+        concurrency=workers,
+        on_expired=on_expired,
+    )
+    METRICS.gauge("pending_scans", lambda: len(scheduler))
+    skip = None
+    if resume is not None:
+        skip = resume.is_started
+        in_flight = resume.in_flight()
+        logger.info(f"Resuming: polling {len(in_flight)} scans in flight again")
+        for scan_id, host, _port in in_flight:
+            scheduler.add(scan_id, (host, _port))
+    polling = asyncio.create_task(scheduler.run())
+    try:
+        await scan_file(file_path, temp, port, concurrency,
+                        on_queued=lambda scan_id, host, _port: scheduler.add(scan_id, (host, _port)),
+                        journal=journal, skip=skip, shard=shard, prefilter=prefilter)
+    finally:
+        scheduler.close()
+        await polling
+
+async def get_results_from_file(uuid_file: str, path: str = None, temp: str = None,
+                                workers: int = DEFAULT_RESULT_WORKERS, deadline: float = DEFAULT_DEADLINE,
+                                rate: float = DEFAULT_RATE):
+    """
+    Gets the results of every scan listed in a uuid file at once.
+
+    All scans stay in a pending set and are polled out of order, so each result is
+    saved or printed as soon as it is ready and a slow scan does not hold back the rest.
+
+    Args:
+        uuid_file (str): The path to a file with one uuid:port per line.
+        path (str): The path to the directory where the results will be saved. Defaults to None.
+        workers (int): Maximum number of result polls in flight. Defaults to DEFAULT_RESULT_WORKERS.
+        deadline (float): Seconds after which a pending scan is given up. Defaults to DEFAULT_DEADLINE.
+        rate (float): Maximum result polls per second. Defaults to DEFAULT_RATE.
+
+    Returns:
+        None
+    """
+    logger = logging.getLogger(__name__)
+    scheduler = PollScheduler(
+        fetch_result,
+        lambda result, _: output_result(result, path, temp),
+        deadline=deadline,
+        rate=rate,
+        concurrency=workers,
+    )
+    METRICS.gauge("pending_scans", lambda: len(scheduler))
+    with open(uuid_file, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            uuid, _, port = line.partition(":")
+            scheduler.add(uuid, port)
+    logger.info(f"Getting results for {len(scheduler)} scans from {uuid_file}")
+    scheduler.close()
+    await scheduler.run()
+
+async def get_result(path: str=None, uuid: str=None, temp: str=None, uuid_file: str=None,
+                     deadline: float = DEFAULT_DEADLINE, workers: int = DEFAULT_RESULT_WORKERS,
+                     rate: float = DEFAULT_RATE) -> None:
     """
     Gets the result of a scan from the API.
 
@@ -294,83 +801,21 @@ async def get_result(path: str=None, uuid: str=None, temp: str=None, uuid_file:
             for all of them.
         save (bool): If True, the result will be saved to a file in the
             given path. Defaults to False.
+        uuid_file (str): A file with one uuid:port per line. Its scans are fetched in a batch.
+        deadline (float): Seconds after which polling a scan gives up. Defaults to DEFAULT_DEADLINE.
+        workers (int): Maximum number of result polls in flight for a batch. Defaults to DEFAULT_RESULT_WORKERS.
+        rate (float): Maximum result polls per second for a batch. Defaults to DEFAULT_RATE.
 
     Returns:
         None
     """
+    import requests
     try:
         logger = logging.getLogger(__name__)
-        response = None
         if uuid:
-            logger.info(f"Getting result for {uuid}")
-            while response is None:
-                response = requests.get(
-                    f"{API_HEADERS_DOCTOR}/results/get_result/{uuid}",
-                    headers={"Accept": "application/json"}
-                )
-                if response.status_code == 200:
-                    if response.json():
-                        if path:
-                            write_response(response.json(), temp=temp, path=path)
-                        else:
-                            print(response.json())
-                    else:
-                        response = None
-        elif uuid_file:
-            with open(uuid_file, "r+") as file:
-                lines = file.readlines()
-                for line in lines:
-                    are_results_ready = True
-                    line = line.strip()
-                    uuid = line.split(":")[0]
-                    port = line.split(":")[1]
-                    logger.info(f"Getting result for {uuid}")
-                    while are_results_ready:
-                        response = requests.get(
-                            f"{API_HEADERS_DOCTOR}/results/get_result/{uuid}",
-                            headers={"Accept": "application/json"}
-                        )
-                        if response.status_code == 200:
-                            if response.json():
-                                if path:
-                                    write_response(response.json(), temp=temp, path=path)
-                                    are_results_ready = False
-                                else:
-                                    print(response.json())
-                                    are_results_ready = False
-                            else:
-                                are_results_ready = True
-                        else:
-                            are_results_ready = False
+            wait_for_result(uuid, path, temp, deadline)
         else:
-            with open(f"{temp}/uuids.txt", "r+") as file:
-                lines = file.readlines()
-                for line in lines:
-                    are_results_ready = True
-                    line = line.strip()
-                    uuid = line.split(":")[0]
-                    port = line.split(":")[1]
-
-                    while are_results_ready:
-                        logger.info(f"Getting result for {uuid}")
-                        response = requests.get(
-                            f"{API_HEADERS_DOCTOR}/results/get_result/{uuid}",
-                            headers={"Accept": "application/json"}
-                        )
-                        if response.status_code == 200:
-                            if response.json():
-                                if path:
-                                    write_response(response.json(), temp=temp, path=path)
-                                    are_results_ready = False
-                                else:
-                                    print(response.json())
-                                    are_results_ready = False
-                            else:
-                                are_results_ready = True
-                        else:
-                            are_results_ready = False
-                            
-        # while True:
+            await get_results_from_file(uuid_file or f"{temp}/uuids.txt", path, temp, workers, deadline, rate)
     except ValueError as e:
         logger.error(f"Error: {e}")
     except FileNotFoundError as e:
@@ -382,10 +827,13 @@ async def get_result(path: str=None, uuid: str=None, temp: str=None, uuid_file:
         logger.error(f"Error: {e}")
     return None
     
-def create_temp():
+def create_temp(suffix: str = ""):
     """
     Creates a directory named 'temp' if it does not exist.
 
+    Args:
+        suffix (str): Appended to the name, so shards started in the same second do not share it. Defaults to "".
+
     Returns:
         str: The path to the 'temp' directory.
     """
@@ -393,7 +841,7 @@ def create_temp():
     try:
         logger = logging.getLogger(__name__)
         today = datetime.datetime.now()
-        date_string = today.strftime('%Y_%m_%dT%H_%M_%S')
+        date_string = today.strftime('%Y_%m_%dT%H_%M_%S') + suffix
         if not os.path.exists(f"temp_{date_string}"):
             os.makedirs(f"temp_{date_string}")
         return f"temp_{date_string}"
@@ -417,61 +865,232 @@ async def main():
     - save_temp: If this argument is given, the script will save the temporary files.
     - get_result_from_file: If this argument is given, the script will get the results from a file.
     - get_result_from_uuid: If this argument is given, the script will get the result from a UUID.
+    - concurrency: Maximum number of scan submissions in flight when scanning a file.
+    - api_url: Base URL of the Headers Doctor API, e.g. a local mock_server.py.
+    - result_workers: Maximum number of result polls in flight for a batch of scans.
+    - poll_deadline: Seconds after which a pending scan is given up.
+    - poll_rate: Maximum result polls per second for a batch of scans.
+    - pool_size: Maximum number of kept-alive connections to the API.
+    - rate_limit: Maximum requests per second to the API, shared by every request.
+    - max_retries: Retries of a request that failed with 429, 5xx or a connection error.
+    - breaker_threshold: Consecutive 5xx or connection errors that pause every request.
+    - breaker_cooldown: Seconds the requests are paused.
+    - connect_timeout: Seconds a connection to the API may take before the request is retried.
+    - read_timeout: Seconds the API may take to answer before the request is retried.
+    - cache: SQLite file caching results, so hosts scanned within cache_ttl are not submitted again.
+    - cache_ttl: Seconds a cached result stays fresh.
+    - cache_size: Maximum number of cached results.
+    - output_format: Format of the results saved with save_response_to_file.
+    - journal: File where the state of every host of a file scan is recorded.
+    - resume: If this argument is given, the scan resumes the run recorded in the journal.
+    - progress: If this argument is given, a live progress line with the ETA is shown.
+    - metrics_file: File where the metrics of the run are written, as JSON or in the Prometheus format.
+    - diff: SQLite file with the fingerprints of the previous runs, so only changed results are written.
+    - store: SQLite results store where every result is saved, indexed by host, port, date and score.
+    - query: If this argument is given, the results in the store matching the query options are printed.
+    - import_dir: Directory of results saved with -s in the dir format to import into the store.
+    - score_only: If this argument is given, only the security score of every host is requested, without a full scan.
+    - score_file: CSV or .jsonl file where the scores are written.
+    - log_level: Level of the messages logged to the console and to scan_headers.log.
+    - shard: Scan only the hosts of shard i/N of the file, writing to per-shard outputs.
+    - shards: Scan the file in N shards run by a local pool of processes, then merge their outputs.
+    - processes: Maximum number of shards running at once.
+    - merge: If this argument is given, the per-shard outputs and journals are merged.
 
     The function prints the results of the scan to the console and saves them to a file if 
     requested. It also handles exceptions and cleans up temporary files.
     """
+    global API_HEADERS_DOCTOR
     import argparse
-    temp_dir = create_temp()
     
     parser = argparse.ArgumentParser(description='Scan a website and save results to file.')
     parser.add_argument('-u', '--scan_by_url', type=str, nargs='?', help='URL to scan.', required=False)
-    parser.add_argument('-p', '--port', type=int, default=443, help='Port (default 443).', required=False)
+    parser.add_argument('-p', '--port', type=int, help='Port (default 443, or the port picked by the API with --score_only).', required=False)
     parser.add_argument('-f', '--file', type=str, help='File with list of urls to scan.', required=False)
     parser.add_argument('-s', '--save_response_to_file', help='if this param is given, scan_headers will save all the results in your_directory/results/url/url_port.json else it only print the results.', required=False)
+    parser.add_argument('-o', '--output_format', choices=OUTPUT_FORMATS, default="dir", help='Format of the results saved with -s: dir writes your_directory/url_port/date.json, the others write a single results file in your_directory (default dir).', required=False)
     parser.add_argument('--save_temp', action='store_true', help='if this param is given, scan_headers will save all the temp files.', required=False)
     parser.add_argument('--get_result_from_file', help='if this param is given, scan_headers will get all the results from temp/uuids.txt', required=False)
     parser.add_argument('--get_result_from_uuid', type=str, help='if this param is given, scan_headers will get the result from the uuid given.', required=False)
+    parser.add_argument('--api_url', type=str, default=API_HEADERS_DOCTOR, help=f'Base URL of the Headers Doctor API (default {API_HEADERS_DOCTOR}).', required=False)
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=f'Maximum number of scan submissions in flight when scanning a file (default {DEFAULT_CONCURRENCY}).', required=False)
+    parser.add_argument('-w', '--result_workers', type=int, default=DEFAULT_RESULT_WORKERS, help=f'Maximum number of result polls in flight while a file is being scanned or results are fetched from a file (default {DEFAULT_RESULT_WORKERS}).', required=False)
+    parser.add_argument('--rate_limit', type=float, default=0, help='Maximum requests per second to the API, shared by every request, 0 for no limit (default 0).', required=False)
+    parser.add_argument('--max_retries', type=int, default=DEFAULT_MAX_RETRIES, help=f'Retries of a request that failed with 429, 5xx or a connection error, honoring Retry-After (default {DEFAULT_MAX_RETRIES}).', required=False)
+    parser.add_argument('--breaker_threshold', type=int, default=DEFAULT_BREAKER_THRESHOLD, help=f'Consecutive 5xx or connection errors that pause every request for --breaker_cooldown seconds (default {DEFAULT_BREAKER_THRESHOLD}).', required=False)
+    parser.add_argument('--breaker_cooldown', type=float, default=DEFAULT_BREAKER_COOLDOWN, help=f'Seconds the requests are paused when the breaker opens (default {DEFAULT_BREAKER_COOLDOWN:g}).', required=False)
+    parser.add_argument('--connect_timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT, help=f'Seconds a connection to the API may take before the request is retried (default {DEFAULT_CONNECT_TIMEOUT:g}).', required=False)
+    parser.add_argument('--read_timeout', type=float, default=DEFAULT_READ_TIMEOUT, help=f'Seconds the API may take to send a response before the request is retried (default {DEFAULT_READ_TIMEOUT:g}).', required=False)
+    parser.add_argument('--cache', type=str, help='SQLite file caching results, so hosts scanned within --cache_ttl are not submitted again.', required=False)
+    parser.add_argument('--cache_ttl', type=float, default=DEFAULT_CACHE_TTL, help=f'Seconds a cached result stays fresh (default {DEFAULT_CACHE_TTL}).', required=False)
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE, help=f'Maximum number of cached results, least recently used are evicted first (default {DEFAULT_CACHE_SIZE}).', required=False)
+    parser.add_argument('--journal', type=str, help='File where the state of every host of a file scan is recorded, so the scan can be resumed.', required=False)
+    parser.add_argument('--resume', action='store_true', help='if this param is given, scan_headers will skip the hosts done in --journal and poll again the scans in flight.', required=False)
+    parser.add_argument('--poll_deadline', type=float, default=DEFAULT_DEADLINE, help=f'Seconds after which a pending scan is given up (default {DEFAULT_DEADLINE:g}).', required=False)
+    parser.add_argument('--pool_size', type=int, default=DEFAULT_POOL_SIZE, help=f'Maximum number of kept-alive connections to the API, at least concurrency + result_workers for best reuse (default {DEFAULT_POOL_SIZE}).', required=False)
+    parser.add_argument('--poll_rate', type=float, default=DEFAULT_RATE, help=f'Maximum result polls per second while a file is being scanned or results are fetched from a file, 0 for no limit (default {DEFAULT_RATE:g}).', required=False)
+    parser.add_argument('--progress', action='store_true', help='if this param is given, scan_headers will show a live progress line with the ETA and only log warnings and errors to the console.', required=False)
+    parser.add_argument('--metrics_file', type=str, help='File where the counters, gauges and stage timings of the run are written at the end, in the Prometheus text format if it ends with .prom and as JSON otherwise.', required=False)
+    parser.add_argument('--shard', type=parse_shard, help='Scan only the hosts of shard i/N of the file (0 <= i < N), chosen by a consistent hash of the hostname. The results go to -s/shard_i_of_N and the journal and metrics to per-shard files.', required=False)
+    parser.add_argument('--shards', type=int, help='Scan the file in this many shards, each one run by its own scan_headers process, and merge their outputs at the end.', required=False)
+    parser.add_argument('--processes', type=int, help='Maximum number of shards running at once with --shards (default: number of CPUs).', required=False)
+    parser.add_argument('--merge', action='store_true', help='if this param is given, scan_headers will merge the outputs in -s/shard_i_of_N and the shard journals of --journal, e.g. after running the shards on several machines.', required=False)
+    parser.add_argument('--diff', type=str, help='SQLite file keeping a fingerprint of the headers and score of every host, so only the hosts whose posture changed since the previous run are saved or printed.', required=False)
+    parser.add_argument('--store', type=str, help='SQLite results store where every result is also saved, indexed by host, port, date and score.', required=False)
+    parser.add_argument('--query', action='store_true', help='if this param is given, scan_headers will print the results in --store matching --query_host, --since, --until, --min_score and --max_score as JSON lines.', required=False)
+    parser.add_argument('--query_host', type=str, help='Hostname pattern of --query, with * as a wildcard.', required=False)
+    parser.add_argument('--since', type=str, help='Only query results from this date on, e.g. 2024-01-31.', required=False)
+    parser.add_argument('--until', type=str, help='Only query results before this date.', required=False)
+    parser.add_argument('--min_score', type=float, help='Only query results with at least this score.', required=False)
+    parser.add_argument('--max_score', type=float, help='Only query results with at most this score.', required=False)
+    parser.add_argument('--latest', action='store_true', help='if this param is given, --query only considers the latest result of every host between --since and --until.', required=False)
+    parser.add_argument('--group_by', choices=tuple(GROUP_BY), help='Print the count and the average, minimum and maximum score of the queried results per host, port or day instead of the results.', required=False)
+    parser.add_argument('--import_dir', type=str, help='Import the results saved in the dir format (your_directory/url_port/date.json) into --store.', required=False)
+    parser.add_argument('--score_only', action='store_true', help='if this param is given, scan_headers will only get the security score of the URL or of every host of the file from /results/scores, without queuing scans, and stream host,port,score,date rows.', required=False)
+    parser.add_argument('--score_file', type=str, help='File the --score_only rows are appended to, as JSON Lines if it ends with .jsonl and as CSV otherwise (default: CSV on stdout).', required=False)
+    parser.add_argument('--prefilter', action='store_true', help='if this param is given, scan_headers will resolve every host of the file and probe its ports with a TCP connect before submitting it, dropping the hosts that do not resolve or accept no connection and submitting the others once on the live port.', required=False)
+    parser.add_argument('--prefilter_ports', type=parse_ports, default=DEFAULT_PREFILTER_PORTS, help=f'Comma-separated ports probed by --prefilter, in order of preference, after -p, for the hosts that do not set one (default {",".join(map(str, DEFAULT_PREFILTER_PORTS))}).', required=False)
+    parser.add_argument('--prefilter_timeout', type=float, default=DEFAULT_PREFILTER_TIMEOUT, help=f'Seconds a --prefilter connection attempt may take (default {DEFAULT_PREFILTER_TIMEOUT:g}).', required=False)
+    parser.add_argument('--prefilter_concurrency', type=int, default=DEFAULT_PREFILTER_CONCURRENCY, help=f'Maximum number of hosts being resolved and probed at once by --prefilter (default {DEFAULT_PREFILTER_CONCURRENCY}).', required=False)
+    parser.add_argument('--log_level', choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="INFO", help='Level of the messages logged to the console and to scan_headers.log (default INFO).', required=False)
     try:
         args = parser.parse_args()
     except Exception as e:
         logger.error(f"Error parsing arguments: {e}")
         raise e
+    # Without -p, --score_only lets the API pick the port like get_headers_score.sh, the scans use 443
+    score_port = args.port
+    if args.port is None:
+        args.port = 443
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+    if (args.query or args.import_dir) and not args.store:
+        parser.error("--query and --import_dir require --store")
+    if args.shards and (args.shard or not args.file):
+        parser.error("--shards requires -f and cannot be combined with --shard")
+    # Per-host messages would break the progress line, they still go to scan_headers.log
+    setup_logging(args.log_level, "WARNING" if args.progress and args.log_level in ("DEBUG", "INFO") else None)
+
+    # Query results are printed as JSON lines, so nothing else is written to stdout
+    if args.query or args.import_dir:
+        import json
+        logger = logging.getLogger(__name__)
+        store = ResultStore(args.store)
+        try:
+            if args.import_dir:
+                logger.info(f"Imported {store.import_directory(args.import_dir)} results from {args.import_dir} into {args.store}")
+            if args.query:
+                for row in store.query(args.query_host, args.since, args.until, args.min_score, args.max_score,
+                                       args.latest, args.group_by):
+                    print(json.dumps(row))
+        except Exception as e:
+            logger.error(f"Error: {e}")
+        finally:
+            store.close()
+        return
 
-    print(f"""
+    # Without --score_file the score rows are streamed as CSV, so nothing else is written to stdout
+    if not args.score_only or args.score_file:
+        print(f"""
         Scanning:
         \tURL: {args.scan_by_url if args.scan_by_url else "False"}
         \tPort: {args.port if args.port else "False"}
         \tFile: {args.file if args.file else "False"}
         \tSave response: {args.save_response_to_file if args.save_response_to_file else "False"}
+        \tOutput format: {args.output_format}
         \tSave temp: {args.save_temp if args.save_temp else "False"}
         \tGet result from file: {args.get_result_from_file if args.get_result_from_file else "False"}
         \tGet result from uuid: {args.get_result_from_uuid if args.get_result_from_uuid else "False"}
+        \tConcurrency: {args.concurrency}
+        \tResult workers: {args.result_workers}
+        \tPoll deadline: {args.poll_deadline:g}s
+        \tPoll rate: {args.poll_rate:g}/s
+        \tPool size: {args.pool_size}
+        \tRate limit: {f"{args.rate_limit:g}/s" if args.rate_limit else "False"}
+        \tMax retries: {args.max_retries}
+        \tTimeouts: {args.connect_timeout:g}s connect, {args.read_timeout:g}s read
+        \tCache: {args.cache if args.cache else "False"}
+        \tJournal: {args.journal if args.journal else "False"}{" (resume)" if args.resume else ""}
+        \tStore: {args.store if args.store else "False"}
+        \tDiff: {args.diff if args.diff else "False"}
+        \tPrefilter: {f"{','.join(map(str, args.prefilter_ports))} ({args.prefilter_timeout:g}s)" if args.prefilter else "False"}
+        \tMetrics file: {args.metrics_file if args.metrics_file else "False"}
+        \tShard: {f"{args.shard[0]}/{args.shard[1]}" if args.shard else args.shards if args.shards else "False"}
     """)
+
+    if args.shards or args.merge:
+        logger = logging.getLogger(__name__)
+        try:
+            if args.shards:
+                codes = run_shards(sys.argv[1:], args.shards, args.processes)
+                logger.info(f"{codes.count(0)} of {args.shards} shards finished")
+            merge_shards(args.save_response_to_file, args.output_format, args.journal, args.score_file)
+        except Exception as e:
+            logger.error(f"Error: {e}")
+        return
+
+    if args.shard:
+        if args.save_response_to_file:
+            args.save_response_to_file = os.path.join(args.save_response_to_file, shard_name(args.shard))
+        if args.metrics_file:
+            args.metrics_file = shard_file(args.metrics_file, args.shard)
+        if args.score_file:
+            args.score_file = shard_file(args.score_file, args.shard)
+    # The score only mode saves no uuids nor invalid URLs
+    temp_dir = create_temp(f"_{shard_name(args.shard)}" if args.shard else "") if not args.score_only else None
     
+    API_HEADERS_DOCTOR = args.api_url.rstrip("/")
+
+    journal = None
+    progress = None
     try:
         logger = logging.getLogger(__name__)
+        METRICS.reset()
+        if args.progress:
+            count_file = args.file or args.get_result_from_file
+            progress = asyncio.create_task(report_progress(count_lines(count_file) if count_file else None))
+        from http_session import configure_session
+        configure_session(args.pool_size, args.rate_limit, RetryPolicy(args.max_retries),
+                          CircuitBreaker(args.breaker_threshold, args.breaker_cooldown),
+                          (args.connect_timeout, args.read_timeout))
+        configure_cache(args.cache, args.cache_ttl, args.cache_size)
+        configure_writer(args.save_response_to_file, args.output_format, args.store, configure_diff(args.diff))
         
-        if args.scan_by_url:
+        if args.score_only:
+            await score_hosts(args.file, args.scan_by_url, args.score_file, score_port, args.concurrency, args.shard)
+
+        elif args.scan_by_url:
             response = format_url(args.scan_by_url, args.port)
             if response is not None:
-                await get_result(uuid=response[0]['scan_id'], path=args.save_response_to_file, temp=temp_dir)
+                await get_result(uuid=response[0]['scan_id'], path=args.save_response_to_file, temp=temp_dir, deadline=args.poll_deadline)
             else:
                 logger.warning("Invalid URL")
                 
         elif args.file:
-            await asyncio.gather(scan_file(args.file, temp_dir, args.port), get_result(path=args.save_response_to_file, temp=temp_dir))
+            journal_path = shard_file(args.journal, args.shard) if args.journal and args.shard else args.journal
+            resume = None
+            if args.resume:
+                # A shard resumes from the merged journal plus its own, if it was not merged yet
+                resume = ScanJournal.load(journal_path, ScanJournal.load(args.journal) if args.shard else None)
+                if args.shard:
+                    resume.hosts = {key: value for key, value in resume.hosts.items()
+                                    if shard_of(key[0], args.shard[1]) == args.shard[0]}
+            journal = ScanJournal(journal_path) if args.journal else None
+            prefilter = None
+            if args.prefilter:
+                prefilter = Prefilter(args.prefilter_ports, args.prefilter_timeout, args.prefilter_concurrency)
+            await scan_pipeline(args.file, temp_dir, args.port, args.save_response_to_file, args.concurrency,
+                                args.result_workers, args.poll_deadline, args.poll_rate, journal, resume,
+                                args.shard, prefilter)
         
         if args.get_result_from_file:
-            if args.save_response_to_file:
-                await asyncio.gather(get_result(path=args.save_response_to_file, uuid_file=args.get_result_from_file, temp=temp_dir))
-            else:
-                await asyncio.gather(get_result(uuid=args.get_result_from_uuid))
+            await get_result(path=args.save_response_to_file, uuid_file=args.get_result_from_file, temp=temp_dir,
+                             deadline=args.poll_deadline, workers=args.result_workers, rate=args.poll_rate)
         elif args.get_result_from_uuid:
             if args.save_response_to_file:
-                await asyncio.gather(get_result(uuid=args.get_result_from_uuid, path=args.save_response_to_file, temp=temp_dir))
+                await asyncio.gather(get_result(uuid=args.get_result_from_uuid, path=args.save_response_to_file, temp=temp_dir, deadline=args.poll_deadline))
             else:
-                await asyncio.gather(get_result(uuid=args.get_result_from_uuid))
+                await asyncio.gather(get_result(uuid=args.get_result_from_uuid, deadline=args.poll_deadline))
             
     except KeyboardInterrupt:
         logger.info("Exiting gracefully")
@@ -480,7 +1099,18 @@ async def main():
     finally:
         try:
             logger = logging.getLogger(__name__)
-            if not args.save_temp:
+            if progress is not None:
+                progress.cancel()
+                await asyncio.gather(progress, return_exceptions=True)
+            configure_cache(None)
+            configure_writer(None)
+            configure_diff(None)
+            close_temp_files()
+            if journal is not None:
+                journal.close()
+            if args.metrics_file:
+                METRICS.dump(args.metrics_file)
+            if temp_dir and not args.save_temp:
                 import shutil
                 shutil.rmtree(temp_dir)
         except KeyboardInterrupt:
@@ -489,5 +1119,12 @@ async def main():
             logger.error(f"Error: {e}")
 
 
-if __name__ == '__main__':
+def cli():
+    """
+    Command line entry point of scan_headers.
+    """
     asyncio.run(main())
+
+
+if __name__ == '__main__':
+    cli()
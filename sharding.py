@@ -0,0 +1,223 @@
+import datetime
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+SHARD_PATTERN = "shard_*_of_*"
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    Parses a shard given as "i/N", with i from 0 to N - 1.
+
+    Args:
+        value (str): The shard, e.g. "0/4".
+
+    Returns:
+        tuple[int, int]: The index of the shard and the number of shards.
+
+    Raises:
+        ValueError: If the shard is not valid.
+    """
+    index, _, shards = value.partition("/")
+    index, shards = int(index), int(shards)
+    if shards < 1 or not 0 <= index < shards:
+        raise ValueError(f"Invalid shard {value}, expected i/N with 0 <= i < N")
+    return index, shards
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash: maps a 64-bit key to one of `buckets` buckets.
+
+    Going from N to N + 1 buckets only moves 1/(N + 1) of the keys, all of them to the new bucket.
+
+    Args:
+        key (int): The key, an unsigned 64-bit integer.
+        buckets (int): The number of buckets.
+
+    Returns:
+        int: The bucket, from 0 to buckets - 1.
+    """
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_of(host: str, shards: int) -> int:
+    """
+    Returns the shard of a normalized hostname. It is the same on every machine and Python version.
+
+    Args:
+        host (str): The normalized hostname.
+        shards (int): The number of shards.
+
+    Returns:
+        int: The shard, from 0 to shards - 1.
+    """
+    key = int.from_bytes(hashlib.blake2b(host.encode(), digest_size=8).digest(), "big")
+    return jump_hash(key, shards)
+
+
+def shard_name(shard: tuple[int, int]) -> str:
+    return f"shard_{shard[0]}_of_{shard[1]}"
+
+
+def shard_file(path: str, shard: tuple[int, int]) -> str:
+    """
+    Returns the per-shard name of a file, keeping its extension, e.g. scan.shard_0_of_4.journal.
+
+    Args:
+        path (str): The path to the file.
+        shard (tuple[int, int]): The index of the shard and the number of shards.
+
+    Returns:
+        str: The path to the file of the shard.
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{shard_name(shard)}{extension}"
+
+
+def _strip_options(argv: list[str], options: tuple[str, ...], flags: tuple[str, ...] = ()) -> list[str]:
+    """
+    Removes options that take a value, in both the "--name value" and "--name=value" forms, and flags.
+    """
+    stripped = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in flags:
+            continue
+        elif arg in options:
+            skip = True
+        elif arg.split("=", 1)[0] not in options:
+            stripped.append(arg)
+    return stripped
+
+
+def run_shards(argv: list[str], shards: int, processes: int = None) -> list[int]:
+    """
+    Runs scan_headers.py once per shard, with at most `processes` shards at a time.
+
+    Every run gets the same arguments plus --shard i/N, without --merge, which the caller
+    runs once the shards are done, and without --progress, as the progress lines of the
+    shards would overwrite each other on the shared terminal.
+
+    Args:
+        argv (list[str]): The arguments of scan_headers.py, without --shards and --processes.
+        shards (int): The number of shards.
+        processes (int): Maximum number of shards running at once. Defaults to the number of CPUs.
+
+    Returns:
+        list[int]: The exit code of every shard.
+    """
+    import subprocess
+    logger = logging.getLogger(__name__)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_headers.py")
+    argv = _strip_options(argv, ("--shards", "--processes", "--shard"), ("--merge", "--progress"))
+
+    def run(index: int) -> int:
+        logger.info(f"Starting shard {index}/{shards}")
+        code = subprocess.run([sys.executable, script, *argv, "--shard", f"{index}/{shards}"]).returncode
+        if code:
+            logger.error(f"Shard {index}/{shards} exited with code {code}")
+        return code
+
+    with ThreadPoolExecutor(max_workers=processes or os.cpu_count() or 1) as executor:
+        return list(executor.map(run, range(shards)))
+
+
+def _merge_results(path: str, shard_directories: list[str], output_format: str):
+    if output_format == "dir":
+        for directory in shard_directories:
+            for root, _, files in os.walk(directory):
+                target = os.path.join(path, os.path.relpath(root, directory))
+                os.makedirs(target, exist_ok=True)
+                for name in files:
+                    os.replace(os.path.join(root, name), os.path.join(target, name))
+        return
+    parts = sorted(part for directory in shard_directories
+                   for part in glob.glob(os.path.join(directory, f"results_*.{output_format}")))
+    if not parts:
+        return
+    date_string = datetime.datetime.now().strftime('%Y_%m_%dT%H_%M_%S')
+    merged = os.path.join(path, f"results_{date_string}.{output_format}")
+    if output_format == "parquet":
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Merging the parquet output format requires the pyarrow package")
+        writer = None
+        for part in parts:
+            table = pyarrow.parquet.read_table(part)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(merged, table.schema)
+            writer.write_table(table)
+        writer.close()
+        return
+    # gzip members and zstd frames can be concatenated, so every JSON Lines format is merged byte for byte
+    with open(merged, "ab") as out:
+        for part in parts:
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, out)
+
+
+def _merge_lines(path: str, header: bool = False) -> int:
+    root, extension = os.path.splitext(path)
+    parts = sorted(glob.glob(f"{glob.escape(root)}.{SHARD_PATTERN}{glob.escape(extension)}"))
+    with open(path, "a") as out:
+        for part in parts:
+            with open(part, "r") as f:
+                if header and out.tell() > 0:
+                    f.readline()
+                for line in f:
+                    # A shard that crashed mid-write leaves a truncated last line
+                    if line.endswith("\n"):
+                        out.write(line)
+    for part in parts:
+        os.remove(part)
+    return len(parts)
+
+
+def merge_shards(path: str = None, output_format: str = "dir", journal: str = None, score_file: str = None):
+    """
+    Combines the outputs and journals of every shard into a single result set.
+
+    The results in path/shard_i_of_N are moved into `path`, into a single results file
+    for the file formats. The shard journals are appended to `journal`, so a later
+    --resume sees every host, and the shard score files to `score_file`. The shard
+    directories and files are removed once merged.
+
+    Args:
+        path (str): The directory given to the shards with -s. Defaults to None.
+        output_format (str): One of writers.OUTPUT_FORMATS. Defaults to "dir".
+        journal (str): The journal given to the shards with --journal. Defaults to None.
+        score_file (str): The file given to the shards with --score_file. Defaults to None.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the parquet format is merged without pyarrow installed.
+    """
+    logger = logging.getLogger(__name__)
+    if path:
+        shard_directories = sorted(d for d in glob.glob(os.path.join(path, SHARD_PATTERN)) if os.path.isdir(d))
+        _merge_results(path, shard_directories, output_format)
+        for directory in shard_directories:
+            shutil.rmtree(directory)
+        logger.info(f"Merged the results of {len(shard_directories)} shards into {path}")
+    if journal:
+        logger.info(f"Merged the journals of {_merge_lines(journal)} shards into {journal}")
+    if score_file:
+        # Every CSV shard starts with a header, only the first one is kept
+        merged = _merge_lines(score_file, header=not score_file.endswith(".jsonl"))
+        logger.info(f"Merged the scores of {merged} shards into {score_file}")
@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from typing import Iterator
+from codec import ResultRecord, as_record, loads
+
+GROUP_BY = {
+    "host": ("host", "port"),
+    "port": ("port",),
+    "day": ("substr(date, 1, 10) AS day",),
+}
+IMPORT_BATCH_SIZE = 1000
+
+
+class ResultStore:
+    """
+    Local SQLite store of every result ever saved, indexed by host, port, date and score.
+
+    A result is identified by its host, port and date, so saving or importing the same
+    result twice keeps a single copy. It can be used as a sink of writers.ResultWriter.
+
+    Args:
+        path (str): The path to the SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shards may write into the same store, so writers wait for each other's commits
+        import sqlite3
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " host TEXT NOT NULL, port INTEGER NOT NULL, date TEXT NOT NULL, score REAL,"
+            " scan_id TEXT, result TEXT NOT NULL, PRIMARY KEY (host, port, date))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_date ON results (date)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_score ON results (score)")
+
+    def write_batch(self, records: list[ResultRecord | dict]):
+        """
+        Saves a batch of results in a single transaction.
+
+        Args:
+            records (list[ResultRecord | dict]): The results, or the first items of the results returned by the API.
+
+        Returns:
+            None
+        """
+        rows = []
+        for record in map(as_record, records):
+            rows.append((record.url, record.port, record.date, record.score, record.scan_id, record.raw.decode()))
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO results (host, port, date, score, scan_id, result) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def import_directory(self, path: str) -> int:
+        """
+        Imports the results saved in the {path}/{url}_{port}/{date}.json layout of save_scan_result.
+
+        Args:
+            path (str): The path to the directory with the results.
+
+        Returns:
+            int: The number of result files read.
+        """
+        logger = logging.getLogger(__name__)
+        batch = []
+        imported = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(root, name), "rb") as f:
+                        batch.append(loads(f.read()))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping {os.path.join(root, name)}. Error: {e}")
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self.write_batch(batch)
+                    imported += len(batch)
+                    batch = []
+        if batch:
+            self.write_batch(batch)
+            imported += len(batch)
+        return imported
+
+    def query(self, host: str = None, since: str = None, until: str = None, min_score: float = None,
+              max_score: float = None, latest: bool = False, group_by: str = None) -> Iterator[dict]:
+        """
+        Streams the stored results that match the filters, or aggregates of them.
+
+        Every filter is answered from an index, so the cost grows with the number of
+        matching results rather than with the size of the history.
+
+        Args:
+            host (str): Hostname pattern, with * as a wildcard. Defaults to None.
+            since (str): Only results from this date on, e.g. 2024-01-31. Defaults to None.
+            until (str): Only results before this date. Defaults to None.
+            min_score (float): Only results with at least this score. Defaults to None.
+            max_score (float): Only results with at most this score. Defaults to None.
+            latest (bool): Only the latest result of every host and port within the dates. Defaults to False.
+            group_by (str): One of GROUP_BY. If given, yields the count, average, minimum and
+                maximum score of every group instead of the results. Defaults to None.
+
+        Returns:
+            Iterator[dict]: The matching results (host, port, date, score, scan_id) or groups.
+
+        Raises:
+            ValueError: If group_by is unknown.
+        """
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError(f"Unknown group {group_by}, expected one of {', '.join(GROUP_BY)}")
+        where, params = [], []
+        if host:
+            where.append("host LIKE ? ESCAPE '\\'")
+            params.append(host.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "%"))
+        if since:
+            where.append("date >= ?")
+            params.append(since)
+        if until:
+            where.append("date < ?")
+            params.append(until)
+        conditions = " AND ".join(where) or "1"
+        if latest:
+            base = ("SELECT r.host, r.port, r.date, r.score, r.scan_id FROM results r JOIN"
+                    f" (SELECT host, port, MAX(date) AS date FROM results WHERE {conditions} GROUP BY host, port) l"
+                    " ON r.host = l.host AND r.port = l.port AND r.date = l.date")
+        else:
+            base = f"SELECT host, port, date, score, scan_id FROM results WHERE {conditions}"
+        scores = []
+        if min_score is not None:
+            scores.append("score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            scores.append("score <= ?")
+            params.append(max_score)
+        sql = f"SELECT * FROM ({base})" + (f" WHERE {' AND '.join(scores)}" if scores else "")
+        if group_by is not None:
+            columns = ", ".join(GROUP_BY[group_by])
+            names = ", ".join(column.rsplit(" ", 1)[-1] for column in GROUP_BY[group_by])
+            sql = (f"SELECT {columns}, COUNT(*) AS count, AVG(score) AS avg_score, MIN(score) AS min_score,"
+                   f" MAX(score) AS max_score FROM ({sql}) GROUP BY {names} ORDER BY {names}")
+        else:
+            sql += " ORDER BY host, port, date"
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,32 @@
+from codec import ResultRecord, as_record, decode_result, loads
+
+RESULT = b'{"scan_id":"id-a","url":"a.example.com","port":"443","date":"2024-01-31 10:00:00","score":75}'
+
+
+def test_decode_result_keeps_the_bytes_of_the_result():
+    record = decode_result(b"[" + RESULT + b"]\n")
+    assert isinstance(record, ResultRecord)
+    assert record.raw == RESULT
+    assert (record.scan_id, record.url, record.port, record.date, record.score) == (
+        "id-a", "a.example.com", 443, "2024-01-31 10:00:00", 75.0)
+    assert record["scan_id"] == "id-a"
+
+
+def test_decode_result_of_a_pending_scan_is_none():
+    assert decode_result(b"[]") is None
+    assert decode_result("[]") is None
+
+
+def test_decode_result_encodes_indented_bodies_again():
+    record = decode_result(b'[\n  {"url": "a.example.com", "port": 80, "date": "2024-01-31",\n "security_score": "5"}\n]')
+    assert b"\n" not in record.raw
+    assert loads(record.raw) == record.data
+    assert record.score == 5.0
+
+
+def test_as_record():
+    data = loads(RESULT)
+    record = as_record([data])
+    assert record.data == data
+    assert as_record(record) is record
+    assert as_record(data).score == 75.0
@@ -0,0 +1,53 @@
+import pytest
+
+from codec import ResultRecord
+from fingerprints import FingerprintStore, fingerprint
+from writers import DiffSink
+
+
+def result(host, headers, date="2024-01-31"):
+    return {"scan_id": f"id-{date}", "url": host, "port": 443, "date": date, "score": len(headers), "headers": headers}
+
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.records = []
+        self.fail = fail
+
+    def write_batch(self, records):
+        if self.fail:
+            raise OSError("disk full")
+        self.records.extend(records)
+
+    def close(self):
+        pass
+
+
+def test_fingerprint_ignores_volatile_fields_and_order():
+    a = result("a.example.com", {"X-Frame-Options": "DENY", "CSP": ["b", "a"]})
+    b = result("b.example.com", {"csp": ["a", "b"], "x-frame-options": " DENY"}, date="2024-02-01")
+    assert fingerprint(a) == fingerprint(b)
+    assert fingerprint(a) != fingerprint(result("a.example.com", {"X-Frame-Options": "SAMEORIGIN"}))
+
+
+def test_diff_sink_writes_only_changed_results(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fp.db"))
+    first, second = ListSink(), ListSink()
+    DiffSink(first, store).write_batch([ResultRecord(result("a.example.com", {"csp": "x"})),
+                                        ResultRecord(result("b.example.com", {}))])
+    DiffSink(second, store).write_batch([ResultRecord(result("a.example.com", {"csp": "x"}, date="2024-02-01")),
+                                         ResultRecord(result("b.example.com", {"csp": "x"}, date="2024-02-01"))])
+    assert [record.url for record in first.records] == ["a.example.com", "b.example.com"]
+    assert [record.url for record in second.records] == ["b.example.com"]
+    store.close()
+
+
+def test_diff_sink_keeps_a_result_changed_until_it_is_written(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fp.db"))
+    records = [ResultRecord(result("a.example.com", {"csp": "x"}))]
+    with pytest.raises(OSError):
+        DiffSink(ListSink(fail=True), store).write_batch(records)
+    sink = ListSink()
+    DiffSink(sink, store).write_batch(records)
+    assert len(sink.records) == 1
+    store.close()
@@ -0,0 +1,50 @@
+from journal import DONE, FAILED, PENDING, SUBMITTED, JournalState, ScanJournal
+
+
+def write_journal(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+def test_load_keeps_the_last_state_of_every_host(tmp_path):
+    path = tmp_path / "scan.journal"
+    journal = ScanJournal(str(path))
+    journal.record(SUBMITTED, "a.example.com", 443, "id-a")
+    journal.record(SUBMITTED, "b.example.com", 80, "id-b")
+    journal.record(DONE, "a.example.com", 443)
+    journal.record(FAILED, "c.example.com", 443)
+    journal.close()
+    state = ScanJournal.load(str(path))
+    # A DONE record without a scan_id keeps the one it was submitted with
+    assert state.hosts == {
+        ("a.example.com", 443): (DONE, "id-a"),
+        ("b.example.com", 80): (SUBMITTED, "id-b"),
+        ("c.example.com", 443): (FAILED, None),
+    }
+    assert state.in_flight() == [("id-b", "b.example.com", 80)]
+
+
+def test_load_ignores_a_truncated_last_line(tmp_path):
+    path = tmp_path / "scan.journal"
+    write_journal(path, ['{"state": "done", "host": "a.example.com", "port": 443, "scan_id": "id-a"}',
+                         '{"state": "submitted", "host": "b.exa'])
+    assert ScanJournal.load(str(path)).hosts == {("a.example.com", 443): (DONE, "id-a")}
+
+
+def test_load_of_a_missing_journal_is_empty(tmp_path):
+    assert ScanJournal.load(str(tmp_path / "missing.journal")).hosts == {}
+
+
+def test_load_replays_on_top_of_a_state(tmp_path):
+    merged, shard = tmp_path / "scan.journal", tmp_path / "scan.shard_0_of_2.journal"
+    write_journal(merged, ['{"state": "submitted", "host": "a.example.com", "port": 443, "scan_id": "id-a"}'])
+    write_journal(shard, ['{"state": "pending", "host": "a.example.com", "port": 443, "scan_id": null}'])
+    state = ScanJournal.load(str(shard), ScanJournal.load(str(merged)))
+    assert state.hosts == {("a.example.com", 443): (PENDING, "id-a")}
+
+
+def test_is_started_checks_the_fallback_ports():
+    state = JournalState()
+    state.hosts = {("a.example.com", 80): (DONE, "id-a"), ("b.example.com", 443): (FAILED, None)}
+    assert state.is_started("a.example.com", None)
+    assert not state.is_started("a.example.com", 443)
+    assert not state.is_started("b.example.com", None)
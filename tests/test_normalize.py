@@ -0,0 +1,35 @@
+import pytest
+
+from normalize import HostRecord, parse_host, split_valid, validate_hostname
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("example.com", HostRecord("example.com", None, None)),
+    ("  Example.COM  \n", HostRecord("example.com", None, None)),
+    ("https://example.com/", HostRecord("example.com", 443, "https")),
+    ("HTTP://example.com//", HostRecord("example.com", 80, "http")),
+    ("example.com:8443", HostRecord("example.com", 8443, None)),
+    ("http://example.com:8080/", HostRecord("example.com", 8080, "http")),
+    ("example.com:65535", HostRecord("example.com", 65535, None)),
+])
+def test_parse_host(line, expected):
+    assert parse_host(line) == expected
+
+
+@pytest.mark.parametrize("line", ["", "   ", "# a comment"])
+def test_parse_host_skips_blank_lines_and_comments(line):
+    assert parse_host(line) is None
+
+
+@pytest.mark.parametrize("line", ["example.com:0", "example.com:65536", "x.example.com:99999"])
+def test_parse_host_keeps_out_of_range_ports_whole(line):
+    record = parse_host(line)
+    assert record == HostRecord(line, None, None)
+    assert not validate_hostname(record.host)
+
+
+def test_split_valid():
+    valid, invalid = split_valid(["example.com\n", "# comment\n", "not a host\n", "b.example.org:99999\n",
+                                  "https://www.example.org\n"])
+    assert valid == [HostRecord("example.com", None, None), HostRecord("www.example.org", 443, "https")]
+    assert [record.host for record in invalid] == ["not a host", "b.example.org:99999"]
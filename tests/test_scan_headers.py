@@ -0,0 +1,23 @@
+import sqlite3
+
+import scan_headers
+from codec import ResultRecord
+
+
+def result(host, score):
+    return ResultRecord({"scan_id": f"id-{host}", "url": host, "port": 443, "date": "2024-01-31", "score": score})
+
+
+def test_diff_with_a_store_and_no_path_prints_changed_results(tmp_path, capsys):
+    store, fingerprints = str(tmp_path / "store.db"), str(tmp_path / "fp.db")
+    for _ in range(2):
+        scan_headers.configure_writer(None, "dir", store, scan_headers.configure_diff(fingerprints))
+        scan_headers.output_result(result("a.example.com", 50))
+        scan_headers.configure_writer(None)
+        scan_headers.configure_diff(None)
+    # The first run prints the new host, the second one finds it unchanged
+    assert len(capsys.readouterr().out.splitlines()) == 1
+    with sqlite3.connect(fingerprints) as db:
+        assert db.execute("SELECT host FROM fingerprints").fetchall() == [("a.example.com",)]
+    with sqlite3.connect(store) as db:
+        assert db.execute("SELECT COUNT(*) FROM results").fetchone() == (1,)
@@ -0,0 +1,57 @@
+import pytest
+
+from sharding import _strip_options, jump_hash, merge_shards, parse_shard, shard_file, shard_of
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+
+
+@pytest.mark.parametrize("value", ["4/4", "-1/4", "0/0", "1", "a/b"])
+def test_parse_shard_rejects_invalid_shards(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_jump_hash_stays_in_range():
+    for key in range(1000):
+        assert 0 <= jump_hash(key, 7) < 7
+    assert jump_hash(12345, 1) == 0
+
+
+def test_jump_hash_only_moves_keys_to_the_new_bucket():
+    for key in range(2000):
+        before, after = jump_hash(key * 7919, 10), jump_hash(key * 7919, 11)
+        assert after == before or after == 10
+
+
+def test_shard_of_is_stable_and_balanced():
+    hosts = [f"host{i}.example.com" for i in range(4000)]
+    shards = [shard_of(host, 4) for host in hosts]
+    assert shards == [shard_of(host, 4) for host in hosts]
+    # Known values, so a change of hash between versions is caught
+    assert shards[:6] == [1, 3, 2, 0, 0, 2]
+    for shard in range(4):
+        assert 800 < shards.count(shard) < 1200
+
+
+def test_shard_file_keeps_the_extension():
+    assert shard_file("scan.journal", (0, 4)) == "scan.shard_0_of_4.journal"
+    assert shard_file("out/scores.jsonl", (3, 4)) == "out/scores.shard_3_of_4.jsonl"
+
+
+def test_merge_shards_appends_the_shard_journals(tmp_path):
+    journal = tmp_path / "scan.journal"
+    (tmp_path / "scan.shard_0_of_2.journal").write_text('{"host": "a.example.com"}\n')
+    (tmp_path / "scan.shard_1_of_2.journal").write_text('{"host": "b.example.com"}\n{"host": "trunc')
+    merge_shards(journal=str(journal))
+    # The truncated last line of a shard that crashed is left out
+    assert journal.read_text() == '{"host": "a.example.com"}\n{"host": "b.example.com"}\n'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["scan.journal"]
+
+
+def test_strip_options_removes_the_launcher_options():
+    argv = ["-f", "urls.txt", "--shards", "4", "--processes=2", "--merge", "--progress", "-s", "out"]
+    assert _strip_options(argv, ("--shards", "--processes", "--shard"), ("--merge", "--progress")) == \
+        ["-f", "urls.txt", "-s", "out"]
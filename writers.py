@@ -0,0 +1,353 @@
+import datetime
+import logging
+import os
+import queue
+import sys
+import threading
+from codec import ResultRecord, as_record, dumps
+from metrics import METRICS
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+OUTPUT_FORMATS = ("dir", "jsonl", "jsonl.gz", "jsonl.zst", "parquet")
+SCORE_FIELDS = ("host", "port", "score", "date")
+
+
+class DirectorySink:
+    """
+    Writes every result to {path}/{url}_{port}/{date}.json, the layout of save_scan_result,
+    with the JSON of the result as it was returned by the API.
+
+    Args:
+        path (str): The path to the directory where the results will be saved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._directories = set()
+
+    def write_batch(self, records: list[ResultRecord]):
+        for record in records:
+            directory = os.path.join(self.path, f"{record.url}_{record.port}")
+            if directory not in self._directories:
+                os.makedirs(directory, exist_ok=True)
+                self._directories.add(directory)
+            with open(os.path.join(directory, f"{record.date}.json"), "wb") as f:
+                f.write(record.raw)
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Appends every result as one compact line of a JSON Lines file.
+
+    Args:
+        path (str): The path to the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "ab")
+
+    def write_batch(self, records: list[ResultRecord]):
+        self._file.write(b"".join(record.raw + b"\n" for record in records))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class GzipJsonlSink(JsonlSink):
+    """
+    Appends every result to a gzip-compressed JSON Lines file.
+
+    Args:
+        path (str): The path to the file.
+    """
+
+    def __init__(self, path: str):
+        import gzip
+        self.path = path
+        self._file = gzip.open(path, "ab", compresslevel=6)
+
+
+class ZstdJsonlSink(JsonlSink):
+    """
+    Appends every result to a zstd-compressed JSON Lines file. Requires the zstandard package.
+
+    Args:
+        path (str): The path to the file.
+    """
+
+    def __init__(self, path: str):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("The jsonl.zst output format requires the zstandard package")
+        self.path = path
+        self._raw = open(path, "ab")
+        self._file = zstandard.ZstdCompressor().stream_writer(self._raw)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Writes the results to a Parquet file, one row group per batch. Requires the pyarrow package.
+
+    The scan_id, url, port and date of every result are columns of their own and the
+    whole result is kept as JSON in the result column.
+
+    Args:
+        path (str): The path to the file.
+    """
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("The parquet output format requires the pyarrow package")
+        self.path = path
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ("scan_id", pyarrow.string()),
+            ("url", pyarrow.string()),
+            ("port", pyarrow.int32()),
+            ("date", pyarrow.string()),
+            ("result", pyarrow.string()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write_batch(self, records: list[ResultRecord]):
+        columns = {
+            "scan_id": [record.scan_id for record in records],
+            "url": [record.url for record in records],
+            "port": [record.port for record in records],
+            "date": [record.date for record in records],
+            "result": [record.raw.decode() for record in records],
+        }
+        self._writer.write_table(self._pyarrow.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class MultiSink:
+    """
+    Writes every batch to several sinks, e.g. a results file and the results store.
+
+    Args:
+        sinks (list): The sinks.
+    """
+
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+
+    def write_batch(self, records: list[ResultRecord]):
+        for sink in self.sinks:
+            sink.write_batch(records)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class PrintSink:
+    """
+    Prints every result as the list returned by the API, for runs that do not save the results.
+    """
+
+    def write_batch(self, records: list[ResultRecord]):
+        for record in records:
+            print([record.data])
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+
+class DiffSink:
+    """
+    Writes only the results whose posture changed since the previous run, see fingerprints.FingerprintStore.
+
+    The fingerprints of a batch are stored once the wrapped sink has written and flushed
+    it, so a batch that fails to be written is reported as changed again on the next run.
+
+    Args:
+        sink: The sink the changed results are written to.
+        fingerprints (FingerprintStore): The fingerprints of the previous runs.
+    """
+
+    def __init__(self, sink, fingerprints):
+        self.sink = sink
+        self.fingerprints = fingerprints
+
+    def write_batch(self, records: list[ResultRecord]):
+        digests = self.fingerprints.diff([record.data for record in records])
+        changed = [(record, digest) for record, digest in zip(records, digests) if digest is not None]
+        METRICS.inc("results_unchanged", len(records) - len(changed))
+        METRICS.inc("results_changed", len(changed))
+        if not changed:
+            return
+        self.sink.write_batch([record for record, _ in changed])
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+        self.fingerprints.update([record.data for record, _ in changed], [digest for _, digest in changed])
+
+    def close(self):
+        self.sink.close()
+
+
+def open_sink(path: str, output_format: str = "dir"):
+    """
+    Opens the sink for the given output format.
+
+    The dir format writes into the directory `path`. The other formats write a single
+    results_<timestamp> file inside it.
+
+    Args:
+        path (str): The path to the directory where the results will be saved.
+        output_format (str): One of OUTPUT_FORMATS. Defaults to "dir".
+
+    Returns:
+        The sink.
+
+    Raises:
+        ValueError: If the format is unknown or its optional dependency is not installed.
+    """
+    if output_format == "dir":
+        return DirectorySink(path)
+    sinks = {"jsonl": JsonlSink, "jsonl.gz": GzipJsonlSink, "jsonl.zst": ZstdJsonlSink, "parquet": ParquetSink}
+    if output_format not in sinks:
+        raise ValueError(f"Unknown output format {output_format}")
+    os.makedirs(path, exist_ok=True)
+    date_string = datetime.datetime.now().strftime('%Y_%m_%dT%H_%M_%S')
+    return sinks[output_format](os.path.join(path, f"results_{date_string}.{output_format}"))
+
+
+class ResultWriter:
+    """
+    Writes results to a sink from a background thread.
+
+    write() only queues the result; the thread hands them to the sink in batches of up
+    to `batch_size`, or whatever arrived within `flush_interval` seconds.
+
+    Args:
+        sink: The sink the results are written to.
+        batch_size (int): Maximum number of results per batch. Defaults to DEFAULT_BATCH_SIZE.
+        flush_interval (float): Maximum seconds a result waits in the queue. Defaults to DEFAULT_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, sink, batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, result: list):
+        """
+        Queues a result returned by the API to be written.
+
+        Args:
+            result (ResultRecord | list): The result of the scan.
+
+        Returns:
+            None
+        """
+        self._queue.put(as_record(result))
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch and batch[-1] is None:
+                batch.pop()
+                closing = True
+            if batch:
+                try:
+                    with METRICS.timer("write_seconds"):
+                        self.sink.write_batch(batch)
+                    METRICS.inc("results_written", len(batch))
+                except Exception as e:
+                    logger.error(f"It was not possible to write {len(batch)} results. Error: {e}")
+
+    def close(self):
+        """
+        Writes the queued results and closes the sink.
+
+        Returns:
+            None
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.sink.close()
+
+
+class LineWriter:
+    """
+    Appends lines to a text file kept open for the whole run.
+
+    Args:
+        path (str): The path to the file.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def write(self, line: str):
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ScoreWriter:
+    """
+    Streams host, port, score and date rows as JSON Lines if the path ends with .jsonl and as CSV otherwise.
+
+    Every row is flushed as soon as it is written, so the output can be followed while
+    the hosts are scored. A header is written to new CSV files.
+
+    Args:
+        path (str): The path to the file, which is appended to. Defaults to CSV on stdout.
+    """
+
+    def __init__(self, path: str = None):
+        import csv
+        self._lock = threading.Lock()
+        self._jsonl = bool(path) and path.endswith(".jsonl")
+        self._file = open(path, "a", newline="") if path else sys.stdout
+        self._csv = None if self._jsonl else csv.writer(self._file)
+        if self._csv is not None and (not path or self._file.tell() == 0):
+            self._csv.writerow(SCORE_FIELDS)
+
+    def write(self, host: str, port: int, score: any, date: str):
+        with self._lock:
+            if self._jsonl:
+                self._file.write(dumps(dict(zip(SCORE_FIELDS, (host, port, score, date)))).decode() + "\n")
+            else:
+                self._csv.writerow((host, port, score, date))
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not sys.stdout:
+                self._file.close()